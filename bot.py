@@ -3,6 +3,11 @@ from pytz import timezone
 from pyrogram import Client, __version__
 from pyrogram.raw.all import layer
 from config import Config
+from helper.database import jishubotz
+from helper.transfer import stop_session_pools
+from helper.client_pool import client_pool
+from helper.broadcast import resume_broadcasts
+from helper.ratelimit import governor
 from aiohttp import web
 from route import web_server
 import pyromod
@@ -31,6 +36,10 @@ class Bot(Client):
         self.mention = me.mention
         self.username = me.username  
         self.uptime = Config.BOT_UPTIME     
+        await jishubotz.create_indexes()
+        await jishubotz.load_known_users()
+        await client_pool.start(self)
+        await resume_broadcasts(self)
         if Config.WEBHOOK:
             app = web.AppRunner(await web_server())
             await app.setup()       
@@ -49,6 +58,16 @@ class Bot(Client):
             except:
                 print("Please Make This Is Admin In Your Log Channel")
 
+    async def invoke(self, query, *args, **kwargs):
+        # Every send and edit goes through the outbound rate governor
+        return await governor.invoke(super().invoke, query, *args, **kwargs)
+
+    async def stop(self, *args):
+        await stop_session_pools()
+        await client_pool.stop()
+        await super().stop()
+        print("Bot Stopped")
+
 Bot().run()
 
 
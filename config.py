@@ -24,6 +24,41 @@ class Config(object):
     # wes response configuration     
     WEBHOOK = bool(os.environ.get("WEBHOOK", True))
 
+    # ffmpeg job pools, 0 sizes them from the cpu count
+    REMUX_WORKERS  = int(os.environ.get("REMUX_WORKERS", "0"))
+    ENCODE_WORKERS = int(os.environ.get("ENCODE_WORKERS", "0"))
+
+    # ffmpeg niceness per job class and encoder threads, 0 threads lets ffmpeg decide
+    REMUX_NICE     = int(os.environ.get("REMUX_NICE", "5"))
+    ENCODE_NICE    = int(os.environ.get("ENCODE_NICE", "10"))
+    ENCODE_THREADS = int(os.environ.get("ENCODE_THREADS", "0"))
+
+    # local cache of downloaded source files, size in MB
+    MEDIA_CACHE_DIR  = os.environ.get("MEDIA_CACHE_DIR", "cache/media")
+    MEDIA_CACHE_SIZE = int(os.environ.get("MEDIA_CACHE_SIZE", "10240"))
+    THUMB_CACHE_DIR  = os.environ.get("THUMB_CACHE_DIR", "cache/thumbs")
+
+    # overlap download, remux and upload for stream-copy jobs on MKV sources
+    PIPELINE_REMUX = os.environ.get("PIPELINE_REMUX", "True").lower() == "true"
+
+    # keep subtitle menus in Mongo so they survive a restart
+    PERSIST_SESSIONS = os.environ.get("PERSIST_SESSIONS", "False").lower() == "true"
+
+    # media connections per DC for big downloads and uploads, 0 keeps downloads on one
+    TRANSFER_CONNECTIONS = int(os.environ.get("TRANSFER_CONNECTIONS", "0"))
+
+    # helper bots for uploads, they post into the dump channel and must be admins there
+    HELPER_BOT_TOKENS = os.environ.get("HELPER_BOT_TOKENS", "").split()
+    DUMP_CHANNEL = int(os.environ.get("DUMP_CHANNEL", LOG_CHANNEL))
+
+    # broadcast messages per second and concurrent sends
+    BROADCAST_RATE    = int(os.environ.get("BROADCAST_RATE", "25"))
+    BROADCAST_WORKERS = int(os.environ.get("BROADCAST_WORKERS", "20"))
+
+    # outbound messages per second, overall and per chat
+    API_RATE  = int(os.environ.get("API_RATE", "30"))
+    CHAT_RATE = int(os.environ.get("CHAT_RATE", "1"))
+
 
 
 class Txt(object):
@@ -69,6 +104,7 @@ class Txt(object):
 🔗 Size ➠ : {filesize} 
 
 ⏰ Duration ➠ : {duration}</code>
+➪ Also Available - <code>{resolution}</code>, <code>{quality}</code>, <code>{video_codec}</code>, <code>{audio_codec}</code>, <code>{audio_languages}</code>, <code>{subtitle_languages}</code>, In Prefix And Suffix Too
 
 ✏️ <b><u>How To Rename A File</u></b>
 
@@ -82,6 +118,13 @@ class Txt(object):
 ️ <b>⏳️ Done :</b> {0}%
  <b>🚀 Speed :</b> {3}/s
 ️ <b>⏰️ ETA :</b> {4}
+"""
+
+    ENCODE_BAR = """\n
+ <b>🎞️ Encoded :</b> {1} | {2}
+️ <b>⏳️ Done :</b> {0}%
+ <b>🚀 Speed :</b> {3}x
+️ <b>⏰️ ETA :</b> {4}
 """
 
     DONATE_TXT = """
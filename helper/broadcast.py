@@ -0,0 +1,125 @@
+# Jishu Developer
+# Don't Remove Credit 🥺
+# Telegram Channel @JishuBotz
+# Developer @JishuDeveloper
+import time
+import asyncio
+import logging
+import datetime
+from pyrogram.errors import FloodWait, InputUserDeactivated, UserIsBlocked, PeerIdInvalid
+from config import Config
+from .database import jishubotz
+from .ratelimit import TokenBucket, outbound_priority, BROADCAST
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Users fetched and checkpointed at a time, a restart resends at most one batch
+BROADCAST_BATCH = 1000
+# Seconds between edits of the status message
+STATUS_INTERVAL = 10
+
+
+async def send_msg(bot, bucket, user_id, broadcast):
+    while True:
+        await bucket.acquire()
+        try:
+            await bot.copy_message(int(user_id), broadcast['from_chat_id'], broadcast['message_id'])
+            bucket.reward()
+            return 200
+        except FloodWait as e:
+            # Every sender backs off, then this user is tried again
+            bucket.penalize(e.value)
+        except InputUserDeactivated:
+            logger.info(f"{user_id} : Deactivated")
+            return 400
+        except UserIsBlocked:
+            logger.info(f"{user_id} : Blocked The Bot")
+            return 400
+        except PeerIdInvalid:
+            logger.info(f"{user_id} : User ID Invalid")
+            return 400
+        except Exception as e:
+            logger.error(f"{user_id} : {e}")
+            return 500
+
+
+async def start_broadcast(bot, message, sts_msg):
+    """Checkpoint a new broadcast of `message` and run it, progress goes to `sts_msg`"""
+    broadcast = dict(
+        from_chat_id=message.chat.id,
+        message_id=message.id,
+        status_chat_id=sts_msg.chat.id,
+        status_message_id=sts_msg.id,
+        total=await jishubotz.total_users_count(),
+        last_id=None,
+        done=0,
+        success=0,
+        failed=0,
+        started=time.time(),
+        finished=False
+    )
+    broadcast['_id'] = await jishubotz.add_broadcast(broadcast)
+    await run_broadcast(bot, broadcast)
+
+
+async def resume_broadcasts(bot):
+    """Continue broadcasts a restart interrupted from their last checkpoint"""
+    for broadcast in await jishubotz.get_running_broadcasts():
+        asyncio.create_task(run_broadcast(bot, broadcast))
+
+
+async def run_broadcast(bot, broadcast):
+    # Replies to users go first while a broadcast runs, the dispatcher worker
+    # that started it gets its own priority back afterwards
+    with outbound_priority(BROADCAST):
+        bucket = TokenBucket(Config.BROADCAST_RATE)
+        last_status = 0
+
+        async def edit_status(title, summary):
+            try:
+                await bot.edit_message_text(
+                    broadcast['status_chat_id'],
+                    broadcast['status_message_id'],
+                    f"**{title}** \n\n{summary}"
+                )
+            except Exception as e:
+                logger.error(f"Broadcast status : {e}")
+
+        while True:
+            user_ids = await jishubotz.get_user_ids(broadcast['last_id'], BROADCAST_BATCH)
+            if not user_ids:
+                break
+
+            dead = []
+            pending = iter(user_ids)
+
+            async def worker():
+                for user_id in pending:
+                    sts = await send_msg(bot, bucket, user_id, broadcast)
+                    if sts == 200:
+                        broadcast['success'] += 1
+                    else:
+                        broadcast['failed'] += 1
+                    if sts == 400:
+                        dead.append(user_id)
+                    broadcast['done'] += 1
+
+            await asyncio.gather(*(worker() for _ in range(Config.BROADCAST_WORKERS)))
+            if dead:
+                await jishubotz.delete_users(dead)
+            broadcast['last_id'] = user_ids[-1]
+            await jishubotz.update_broadcast(broadcast['_id'], {
+                key: broadcast[key] for key in ('last_id', 'done', 'success', 'failed')
+            })
+
+            summary = f"Total Users {broadcast['total']}\nCompleted: {broadcast['done']} / {broadcast['total']}\nSuccess: {broadcast['success']}\nFailed: {broadcast['failed']}"
+            if time.time() - last_status >= STATUS_INTERVAL:
+                last_status = time.time()
+                await edit_status("Broadcast In Progress:", summary)
+
+        await jishubotz.update_broadcast(broadcast['_id'], {'finished': True})
+        completed_in = datetime.timedelta(seconds=int(time.time() - broadcast['started']))
+        summary = f"Completed In `{completed_in}`.\n\nTotal Users {broadcast['total']}\nCompleted: {broadcast['done']} / {broadcast['total']}\nSuccess: {broadcast['success']}\nFailed: {broadcast['failed']}"
+        await edit_status("Broadcast Completed:", summary)
@@ -0,0 +1,106 @@
+# Jishu Developer
+# Don't Remove Credit 🥺
+# Telegram Channel @JishuBotz
+# Developer @JishuDeveloper
+import time
+from contextlib import asynccontextmanager
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+from config import Config
+from .transfer import send_video_resumable
+
+
+class PooledClient:
+    """A client with its running uploads and FloodWait deadline"""
+
+    def __init__(self, client):
+        self.client = client
+        self.load = 0
+        self.flood_until = 0
+
+
+class ClientPool:
+    """
+    Helper bots that take heavy uploads off the primary bot
+
+    Helpers never handle updates, they upload into the dump channel and the
+    primary bot copies the result to the user, so one token's FloodWait and
+    bandwidth don't cap the whole service. Uploads pick the least loaded
+    helper that isn't waiting out a FloodWait.
+    """
+
+    def __init__(self, tokens):
+        self.primary = None
+        self.helpers = [
+            PooledClient(Client(
+                name=f"helper{i}",
+                api_id=Config.API_ID,
+                api_hash=Config.API_HASH,
+                bot_token=token,
+                in_memory=True,
+                no_updates=True,
+                sleep_threshold=15,
+            ))
+            for i, token in enumerate(tokens)
+        ]
+
+    async def start(self, primary):
+        self.primary = PooledClient(primary)
+        for helper in list(self.helpers):
+            try:
+                await helper.client.start()
+            except Exception as e:
+                print(f"Error starting helper bot {helper.client.name}: {e}")
+                self.helpers.remove(helper)
+
+    async def stop(self):
+        for helper in self.helpers:
+            try:
+                await helper.client.stop()
+            except Exception as e:
+                print(f"Error stopping helper bot {helper.client.name}: {e}")
+
+    def pick(self):
+        """The least loaded client that isn't flood waiting, the primary bot if no helper is free"""
+        now = time.time()
+        ready = [helper for helper in self.helpers if helper.flood_until <= now]
+        if not ready:
+            return self.primary
+        return min(ready, key=lambda helper: helper.load)
+
+    @asynccontextmanager
+    async def acquire(self):
+        pooled = self.pick()
+        pooled.load += 1
+        try:
+            yield pooled.client
+        except FloodWait as e:
+            pooled.flood_until = time.time() + e.value
+            raise
+        finally:
+            pooled.load -= 1
+
+    def target(self, client, chat_id):
+        """Where `client` has to send a file that ends up in `chat_id`"""
+        return chat_id if client is self.primary.client else Config.DUMP_CHANNEL
+
+    async def deliver(self, client, chat_id, sent):
+        """Copy a message a helper sent to the dump channel over to `chat_id` with the primary bot"""
+        if client is self.primary.client:
+            return sent
+        return await self.primary.client.copy_message(chat_id, Config.DUMP_CHANNEL, sent.id)
+
+    async def send_video(self, chat_id, path, file_name, **kwargs):
+        """send_video_resumable on the best client, moving to another one on FloodWait"""
+        for _ in range(len(self.helpers) + 1):
+            try:
+                async with self.acquire() as client:
+                    sent = await send_video_resumable(client, self.target(client, chat_id), path, file_name, **kwargs)
+            except FloodWait as e:
+                print(f"Upload hit a FloodWait of {e.value}s, trying another client")
+                continue
+            return await self.deliver(client, chat_id, sent)
+        raise ConnectionError("Every client is flood waiting")
+
+
+client_pool = ClientPool(Config.HELPER_BOT_TOKENS)
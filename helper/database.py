@@ -1,13 +1,59 @@
+import time
 import motor.motor_asyncio
+from collections import OrderedDict
+from datetime import datetime
 from config import Config
 from .utils import send_log
 
+# Cached results not sent again for this long are dropped by a TTL index
+RESULT_CACHE_TTL = 30 * 24 * 60 * 60
+# Idle subtitle sessions expire after this long, in memory and in Mongo
+SESSION_TTL = 30 * 60
+
+# In-process user settings cache, every set_* writes through to it
+SETTINGS_CACHE_TTL = 10 * 60
+SETTINGS_CACHE_SIZE = 10000
+SETTINGS_PROJECTION = {'_id': 0, 'file_id': 1, 'caption': 1, 'prefix': 1, 'suffix': 1, 'metadata': 1, 'metadata_code': 1}
+
+
+class UserSettings:
+    """Snapshot of one user's settings"""
+
+    __slots__ = ('file_id', 'caption', 'prefix', 'suffix', 'metadata', 'metadata_code', 'expires')
+
+    def __init__(self, user):
+        user = user or {}
+        self.file_id = user.get('file_id')
+        self.caption = user.get('caption')
+        self.prefix = user.get('prefix')
+        self.suffix = user.get('suffix')
+        self.metadata = user.get('metadata')
+        self.metadata_code = user.get('metadata_code')
+        self.expires = time.monotonic() + SETTINGS_CACHE_TTL
+
+
 class Database:
 
     def __init__(self, uri, database_name):
         self._client = motor.motor_asyncio.AsyncIOMotorClient(uri)
         self.jishubotz = self._client[database_name]
         self.col = self.jishubotz.user
+        self.cache = self.jishubotz.cache
+        self.stats = self.jishubotz.stats
+        self.broadcasts = self.jishubotz.broadcasts
+        self.sessions = self.jishubotz.sessions
+        self.probes = self.jishubotz.probes
+        self.settings = OrderedDict()  # user id -> UserSettings, least recently used first
+        # Ids of users already in the collection, spares the hot path a round trip
+        self.known_users = set()
+
+    async def create_indexes(self):
+        await self.cache.create_index('last_used', expireAfterSeconds=RESULT_CACHE_TTL)
+        await self.sessions.create_index('last_used', expireAfterSeconds=SESSION_TTL)
+
+    async def load_known_users(self):
+        async for user in self.col.find({}, {'_id': 1}).batch_size(10000):
+            self.known_users.add(user['_id'])
 
     def new_user(self, id):
         return dict(
@@ -22,13 +68,21 @@ class Database:
 
     async def add_user(self, b, m):
         u = m.from_user
-        if not await self.is_user_exist(u.id):
-            user = self.new_user(u.id)
-            await self.col.insert_one(user)            
+        if u.id in self.known_users:
+            return
+        # Upsert so concurrent first messages can't insert the same user twice
+        user = self.new_user(u.id)
+        del user['_id']
+        result = await self.col.update_one({'_id': u.id}, {'$setOnInsert': user}, upsert=True)
+        self.known_users.add(u.id)
+        if result.upserted_id is not None:
+            self.settings.pop(u.id, None)
             await send_log(b, u)
 
     async def is_user_exist(self, id):
-        user = await self.col.find_one({'_id': int(id)})
+        if int(id) in self.known_users:
+            return True
+        user = await self.col.find_one({'_id': int(id)}, {'_id': 1})
         return bool(user)
 
     async def total_users_count(self):
@@ -41,72 +95,149 @@ class Database:
 
     async def delete_user(self, user_id):
         await self.col.delete_many({'_id': int(user_id)})
+        self.known_users.discard(int(user_id))
+        self.settings.pop(int(user_id), None)
+
+    async def delete_users(self, user_ids):
+        await self.col.delete_many({'_id': {'$in': user_ids}})
+        for user_id in user_ids:
+            self.known_users.discard(user_id)
+            self.settings.pop(user_id, None)
+
+    async def get_user_ids(self, after=None, limit=1000):
+        """Up to `limit` user ids in ascending order, starting after `after`"""
+        query = {'_id': {'$gt': after}} if after is not None else {}
+        cursor = self.col.find(query, {'_id': 1}).sort('_id', 1).limit(limit).batch_size(limit)
+        return [user['_id'] async for user in cursor]
     
 
 
+    #======================= Settings ========================#
+
+    async def get_settings(self, id):
+        """All settings of a user in one read, served from memory while fresh"""
+        id = int(id)
+        settings = self.settings.get(id)
+        if settings is not None and settings.expires > time.monotonic():
+            self.settings.move_to_end(id)
+            return settings
+        settings = UserSettings(await self.col.find_one({'_id': id}, SETTINGS_PROJECTION))
+        self.settings[id] = settings
+        self.settings.move_to_end(id)
+        if len(self.settings) > SETTINGS_CACHE_SIZE:
+            self.settings.popitem(last=False)
+        return settings
+
+    async def set_setting(self, id, key, value):
+        await self.col.update_one({'_id': int(id)}, {'$set': {key: value}})
+        settings = self.settings.get(int(id))
+        if settings is not None:
+            setattr(settings, key, value)
+
+
+
     #======================= Thumbnail ========================#
 
     async def set_thumbnail(self, id, file_id):
-        await self.col.update_one({'_id': int(id)}, {'$set': {'file_id': file_id}})
+        await self.set_setting(id, 'file_id', file_id)
 
     async def get_thumbnail(self, id):
-        user = await self.col.find_one({'_id': int(id)})
-        return user.get('file_id', None)
+        return (await self.get_settings(id)).file_id
     
     
 
     #======================= Caption ========================#
 
     async def set_caption(self, id, caption):
-        await self.col.update_one({'_id': int(id)}, {'$set': {'caption': caption}})
+        await self.set_setting(id, 'caption', caption)
 
     async def get_caption(self, id):
-        user = await self.col.find_one({'_id': int(id)})
-        return user.get('caption', None)
+        return (await self.get_settings(id)).caption
 
 
 
     #======================= Prefix ========================#
 
     async def set_prefix(self, id, prefix):
-        await self.col.update_one({'_id': int(id)}, {'$set': {'prefix': prefix}})  
+        await self.set_setting(id, 'prefix', prefix)  
         
     async def get_prefix(self, id):
-        user = await self.col.find_one({'_id': int(id)})
-        return user.get('prefix', None)      
+        return (await self.get_settings(id)).prefix      
     
 
 
     #======================= Suffix ========================#
 
     async def set_suffix(self, id, suffix):
-        await self.col.update_one({'_id': int(id)}, {'$set': {'suffix': suffix}})  
+        await self.set_setting(id, 'suffix', suffix)  
         
     async def get_suffix(self, id):
-        user = await self.col.find_one({'_id': int(id)})
-        return user.get('suffix', None)
+        return (await self.get_settings(id)).suffix
 
 
 
     #======================= Metadata ========================#
         
     async def set_metadata(self, id, bool_meta):
-        await self.col.update_one({'_id': int(id)}, {'$set': {'metadata': bool_meta}})
+        await self.set_setting(id, 'metadata', bool_meta)
         
     async def get_metadata(self, id):
-        user = await self.col.find_one({'_id': int(id)})
-        return user.get('metadata', None)
+        return (await self.get_settings(id)).metadata
         
         
         
     #======================= Metadata Code ========================#    
         
     async def set_metadata_code(self, id, metadata_code):
-        await self.col.update_one({'_id': int(id)}, {'$set': {'metadata_code': metadata_code}})
+        await self.set_setting(id, 'metadata_code', metadata_code)
 
     async def get_metadata_code(self, id):
-        user = await self.col.find_one({'_id': int(id)})
-        return user.get('metadata_code', None)   
+        return (await self.get_settings(id)).metadata_code   
+
+
+
+    #======================= Result Cache ========================#
+
+    async def get_cached_file(self, key):
+        cached = await self.cache.find_one_and_update({'_id': key}, {'$set': {'last_used': datetime.utcnow()}})
+        await self.stats.update_one({'_id': 'cache'}, {'$inc': {'hits' if cached else 'misses': 1}}, upsert=True)
+        return cached.get('file_id', None) if cached else None
+
+    async def set_cached_file(self, key, file_id):
+        await self.cache.update_one({'_id': key}, {'$set': {'file_id': file_id, 'last_used': datetime.utcnow()}}, upsert=True)
+
+    async def delete_cached_file(self, key):
+        await self.cache.delete_one({'_id': key})
+        await self.stats.update_one({'_id': 'cache'}, {'$inc': {'evictions': 1}}, upsert=True)
+
+    async def get_cache_stats(self):
+        stats = await self.stats.find_one({'_id': 'cache'})
+        return stats or {}
+
+
+
+
+    #======================= Probe Cache ========================#
+
+    async def get_probe(self, file_unique_id):
+        probe = await self.probes.find_one({'_id': file_unique_id}, {'_id': 0})
+        return probe or None
+
+    async def set_probe(self, file_unique_id, probe):
+        await self.probes.update_one({'_id': file_unique_id}, {'$set': probe}, upsert=True)
+
+
+    #======================= Broadcasts ========================#
+
+    async def add_broadcast(self, broadcast):
+        result = await self.broadcasts.insert_one(broadcast)
+        return result.inserted_id
+
+    async def update_broadcast(self, id, fields):
+        await self.broadcasts.update_one({'_id': id}, {'$set': fields})
+
+    async def get_running_broadcasts(self):
+        return await self.broadcasts.find({'finished': False}).to_list(None)
 
 
 
@@ -1,3 +1,436 @@
+# Jishu Developer
+# Don't Remove Credit 🥺
+# Telegram Channel @JishuBotz
+# Developer @JishuDeveloper
+import os
+import csv
+import time
+import signal
+import asyncio
+from collections import deque
+from pyrogram.types import Message
+from config import Config
+from .utils import progress_for_ffmpeg
+
+
+# ASS alignment (numpad layout) for each burn position
+ALIGNMENT_MAP = {
+    "top": 8,
+    "middle": 5,
+    "bottom": 2
+}
+
+# Subtitle codecs MP4 can't hold, as mov_text or otherwise
+BITMAP_SUBTITLE_CODECS = {'hdmv_pgs_subtitle', 'dvd_subtitle', 'dvb_subtitle', 'xsub'}
+
+# Clips shorter than this (in seconds) are burned by a single ffmpeg process
+SEGMENT_MIN_DURATION = 300
+
+# Only the last lines of a process' stderr are kept for error reporting
+STDERR_TAIL_LINES = 30
+# Longest single line accepted from a process pipe
+STREAM_LIMIT = 1024 * 1024
+
+# Wall-clock limit per job class: base seconds plus seconds per second of media
+JOB_TIMEOUTS = {
+    'probe': (60, 0),
+    'remux': (120, 1),
+    'encode': (300, 10)
+}
+
+# Niceness and ffmpeg thread limit per job class
+JOB_LIMITS = {
+    'probe': {'nice': 0, 'threads': 0},
+    'remux': {'nice': Config.REMUX_NICE, 'threads': 0},
+    'encode': {'nice': Config.ENCODE_NICE, 'threads': Config.ENCODE_THREADS}
+}
+
+
+def escape_filter_path(path: str) -> str:
+    """Escape a file path for use inside an ffmpeg filter argument"""
+    return path.replace(':', '\\:')
+
+
+def concat_escape(path: str) -> str:
+    """Escape a file path for a quoted entry of an ffmpeg concat list"""
+    return path.replace("'", "'\\''")
+
+
+def subtitle_filter(
+    subtitle_path: str,
+    font_size: int = 24,
+    font_color: str = "white",
+    bg_color: str = "black@0.5",
+    position: str = "bottom"
+) -> str:
+    """Build the styled `subtitles` filter that burns one subtitle file"""
+    alignment = ALIGNMENT_MAP.get(position.lower(), 2)
+    return (
+        f"subtitles='{escape_filter_path(subtitle_path)}':"
+        f"force_style='Fontsize={font_size},"
+        f"PrimaryColour={font_color},"
+        f"BackColour={bg_color},"
+        f"Alignment={alignment},MarginV=20,"
+        f"Outline=1,Shadow=0'"
+    )
+
+
+def needs_ffmpeg(subs_to_remove=(), subtitles=(), burn_subtitles=(), metadata_code=None):
+    """Whether the requested edits change the file's bytes at all"""
+    return bool(subs_to_remove or subtitles or burn_subtitles or metadata_code)
+
+
+class FFmpegJob:
+    """A single ffmpeg invocation compiled from a subtitle session"""
+
+    def __init__(self, command, output_path, reencode):
+        self.command = command
+        self.output_path = output_path
+        self.reencode = reencode
+
+
+def plan_ffmpeg_job(
+    input_path: str,
+    output_path: str,
+    existing_subs=(),
+    subs_to_remove=(),
+    subtitles=(),
+    burn_subtitles=(),
+    metadata_code: str = None,
+    burned_video: str = None,
+    fragmented: bool = False,
+    bitmap_subs=()
+):
+    """
+    Compile subtitle removal, soft subtitles, burns and metadata into one ffmpeg run
+
+    Parameters:
+    - input_path: Path to the source video
+    - output_path: Path to the processed video
+    - existing_subs: Stream indices of the subtitle tracks in the source
+    - subs_to_remove: Stream indices of the subtitle tracks to drop
+    - subtitles: Paths of subtitle files to add as soft subtitles
+    - burn_subtitles: Dicts with 'path' and 'settings' of subtitles to burn
+    - metadata_code: Title written to the container and every stream
+    - burned_video: Already burned video (see burn_segmented) that replaces
+      the source video stream, burn_subtitles is ignored when given
+    - fragmented: Write fragmented MP4 so the output can go to a pipe
+    - bitmap_subs: Stream indices of subtitle tracks MP4 can't hold, always dropped
+
+    Returns:
+    - FFmpegJob, or None if nothing would change the file
+    """
+    if burned_video:
+        burn_subtitles = ()
+    if not (needs_ffmpeg(subs_to_remove, subtitles, burn_subtitles, metadata_code) or burned_video):
+        return None
+
+    command = ['ffmpeg', '-y', '-i', input_path]
+    for sub in subtitles:
+        command += ['-i', sub]
+
+    if burned_video:
+        command += ['-i', burned_video]
+        command += ['-map', f'{len(subtitles) + 1}:v:0', '-map', '0', '-map', '-0:v']
+    # All burns are chained in one filter graph on the first video stream
+    elif burn_subtitles:
+        chain = ','.join(subtitle_filter(sub['path'], **sub['settings']) for sub in burn_subtitles)
+        command += ['-filter_complex', f"[0:v:0]{chain}[vout]"]
+        command += ['-map', '[vout]', '-map', '0', '-map', '-0:v']
+    else:
+        command += ['-map', '0']
+    # Font attachments, data streams and bitmap subtitles don't fit in MP4
+    command += ['-map', '-0:t?', '-map', '-0:d?']
+    dropped_subs = set(subs_to_remove) | set(bitmap_subs)
+    for idx in sorted(dropped_subs):
+        command += ['-map', f'-0:{idx}']
+    for i in range(len(subtitles)):
+        command += ['-map', f'{i + 1}:0']
+
+    command += ['-c', 'copy', '-c:s', 'mov_text']
+    if burn_subtitles:
+        command += ['-c:v', 'libx264', '-crf', '18', '-preset', 'fast']
+
+    # Soft subtitles are placed after the existing tracks that are kept
+    kept_subs = len([idx for idx in existing_subs if idx not in dropped_subs])
+    for i in range(len(subtitles)):
+        command += [f'-metadata:s:s:{kept_subs + i}', 'language=eng']
+
+    if metadata_code:
+        command += [
+            '-metadata', f'title={metadata_code}',
+            '-metadata:s:v', f'title={metadata_code}',
+            '-metadata:s:a', f'title={metadata_code}',
+            '-metadata:s:s', f'title={metadata_code}',
+        ]
+
+    if fragmented:
+        command += ['-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov+default_base_moof']
+
+    command.append(output_path)
+    return FFmpegJob(command, output_path, reencode=bool(burn_subtitles))
+
+
+def parse_progress(status):
+    """Return encoded seconds and speed from one ffmpeg `-progress` block"""
+    try:
+        # Despite the name, out_time_ms is in microseconds as well
+        seconds = int(status.get('out_time_us') or status.get('out_time_ms')) / 1000000
+    except (TypeError, ValueError):
+        seconds = 0
+    try:
+        speed = float(status.get('speed', '0x').rstrip('x'))
+    except ValueError:
+        speed = 0
+    return seconds, speed
+
+
+def job_timeout(job_class: str, duration: float = 0) -> float:
+    """Wall-clock limit in seconds for a job of `job_class` on media of `duration` seconds"""
+    base, per_second = JOB_TIMEOUTS[job_class]
+    return base + per_second * duration
+
+
+def kill_process_tree(process):
+    """Kill a process started by run_command together with its children"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def run_command(
+    command,
+    on_progress=None,
+    timeout=None,
+    job_class='remux',
+    stdin=None,
+    on_output=None
+):
+    """
+    Run a command, keeping only the tail of its stderr in memory
+
+    ffmpeg commands are given `-progress pipe:1` and `on_progress(seconds, speed)`
+    is awaited for every progress block they print. The process runs in its own
+    process group with the niceness and thread limit of `job_class`; the whole
+    group is killed when `timeout` expires or the calling task is cancelled.
+
+    For streaming jobs `stdin` is an async iterable of bytes fed to the process
+    and `on_output(chunk)` is awaited for every chunk it writes to stdout;
+    ffmpeg progress is not reported then since stdout carries the media.
+
+    Returns:
+    - Exit code, stdout (empty for ffmpeg) and the last lines of stderr
+    """
+    limits = JOB_LIMITS[job_class]
+    is_ffmpeg = command[0] == 'ffmpeg'
+    if is_ffmpeg and on_output is None:
+        command = [command[0], '-progress', 'pipe:1', '-nostats', *command[1:]]
+    elif is_ffmpeg:
+        command = [command[0], '-nostats', *command[1:]]
+    if is_ffmpeg and limits['threads'] and '-threads' not in command:
+        command[-1:-1] = ['-threads', str(limits['threads'])]
+    if limits['nice']:
+        command = ['nice', '-n', str(limits['nice']), *command]
+
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.PIPE if stdin is not None else None,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        limit=STREAM_LIMIT,
+        start_new_session=True,
+    )
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+
+    async def write_stdin():
+        if stdin is None:
+            return
+        try:
+            async for chunk in stdin:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # The process exited early, its exit code tells why
+            pass
+        finally:
+            process.stdin.close()
+            if hasattr(stdin, 'aclose'):
+                await stdin.aclose()
+
+    async def read_stderr():
+        async for line in process.stderr:
+            stderr_tail.append(line.decode(errors='ignore').rstrip())
+
+    async def read_stdout():
+        if on_output is not None:
+            while True:
+                chunk = await process.stdout.read(STREAM_LIMIT)
+                if not chunk:
+                    return b''
+                await on_output(chunk)
+        if not is_ffmpeg:
+            return await process.stdout.read()
+        status = {}
+        async for line in process.stdout:
+            key, _, value = line.decode(errors='ignore').strip().partition('=')
+            status[key] = value
+            if key == 'progress' and on_progress:
+                try:
+                    await on_progress(*parse_progress(status))
+                except Exception as e:
+                    print(f"Error reporting progress: {str(e)}")
+        return b''
+
+    try:
+        stdout, _, _, _ = await asyncio.wait_for(
+            asyncio.gather(read_stdout(), read_stderr(), write_stdin(), process.wait()),
+            timeout
+        )
+    except BaseException:
+        # Timed out or cancelled, don't leave the encode running
+        if process.returncode is None:
+            kill_process_tree(process)
+            await process.wait()
+        raise
+    return process.returncode, stdout, '\n'.join(stderr_tail)
+
+
+async def execute_job(job: FFmpegJob, ms: Message = None, duration: float = 0):
+    """
+    Run a planned ffmpeg job, showing its progress on `ms` when the duration is known
+    Returns output path if successful, None otherwise
+    """
+    try:
+        on_progress = None
+        if ms and duration:
+            start = time.time()
+
+            async def on_progress(seconds, speed):
+                await progress_for_ffmpeg(seconds, duration, speed, "Processing...", ms, start)
+
+        job_class = 'encode' if job.reencode else 'remux'
+        returncode, _, error = await run_command(
+            job.command,
+            on_progress,
+            timeout=job_timeout(job_class, duration),
+            job_class=job_class
+        )
+        if returncode == 0 and os.path.exists(job.output_path):
+            return job.output_path
+        print(f"Error running ffmpeg: {error}")
+        return None
+
+    except asyncio.TimeoutError:
+        print(f"ffmpeg timed out: {job.command}")
+        return None
+
+    except Exception as e:
+        print(f"Error running ffmpeg: {str(e)}")
+        return None
+
+
+async def burn_segmented(
+    input_path: str,
+    work_dir: str,
+    burn_subtitles,
+    duration: float,
+    workers: int,
+    ms: Message = None
+):
+    """
+    Burn subtitles into the first video stream in parallel segments
+
+    The video is split at keyframes with stream copy, every segment is burned
+    by its own single-threaded libx264 process with its timestamps shifted
+    back to the source timeline so the subtitles line up, and the results are
+    joined again with stream copy. Audio and other streams are left to the
+    final pass (see plan_ffmpeg_job's burned_video).
+
+    Returns:
+    - Path to the burned video-only file if successful, None otherwise
+    """
+    try:
+        os.makedirs(work_dir, exist_ok=True)
+        # Twice as many segments as workers evens out uneven keyframe cuts
+        segments = workers * 2
+        step = duration / segments
+        segment_list = os.path.join(work_dir, "segments.csv")
+        returncode, _, error = await run_command([
+            'ffmpeg', '-y', '-i', input_path,
+            '-map', '0:v:0', '-c', 'copy',
+            '-f', 'segment',
+            '-segment_times', ','.join(f"{step * i:.3f}" for i in range(1, segments)),
+            '-segment_list', segment_list,
+            '-segment_list_type', 'csv',
+            '-reset_timestamps', '1',
+            os.path.join(work_dir, "src_%03d.mkv")
+        ], timeout=job_timeout('remux', duration))
+        if returncode != 0:
+            print(f"Error splitting video: {error}")
+            return None
+
+        with open(segment_list, newline='') as f:
+            parts = [(os.path.join(work_dir, os.path.basename(row[0])), float(row[1])) for row in csv.reader(f) if row]
+
+        chain = ','.join(subtitle_filter(sub['path'], **sub['settings']) for sub in burn_subtitles)
+        semaphore = asyncio.Semaphore(workers)
+        # Seconds burned so far per segment, summed into one progress bar
+        done = [0] * len(parts)
+        started = time.time()
+
+        async def burn_part(index, path, start):
+            output = os.path.join(work_dir, f"out_{index:03d}.mkv")
+
+            async def on_progress(seconds, speed):
+                done[index] = seconds
+                if ms:
+                    burned = sum(done)
+                    await progress_for_ffmpeg(
+                        burned, duration, burned / max(time.time() - started, 1),
+                        "Burning subtitles...", ms, started
+                    )
+
+            async with semaphore:
+                returncode, _, error = await run_command([
+                    'ffmpeg', '-y', '-i', path,
+                    '-vf', f"setpts=PTS+{start}/TB,{chain},setpts=PTS-STARTPTS",
+                    '-c:v', 'libx264', '-crf', '18', '-preset', 'fast',
+                    '-threads', '1',
+                    output
+                ], on_progress, timeout=job_timeout('encode', step * 2), job_class='encode')
+            if returncode != 0:
+                raise RuntimeError(error)
+            return output
+
+        outputs = await asyncio.gather(
+            *(burn_part(i, path, start) for i, (path, start) in enumerate(parts)),
+            return_exceptions=True
+        )
+        for output in outputs:
+            if isinstance(output, Exception):
+                print(f"Error burning segment: {str(output)}")
+                return None
+
+        concat_list = os.path.join(work_dir, "concat.txt")
+        with open(concat_list, 'w') as f:
+            # Quotes in the user's file name end the quoted path otherwise
+            f.writelines(f"file '{concat_escape(os.path.abspath(output))}'\n" for output in outputs)
+        burned_path = os.path.join(work_dir, "burned.mkv")
+        returncode, _, error = await run_command([
+            'ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', concat_list,
+            '-c', 'copy', burned_path
+        ], timeout=job_timeout('remux', duration))
+        if returncode != 0:
+            print(f"Error joining segments: {error}")
+            return None
+        return burned_path
+
+    except Exception as e:
+        print(f"Error in segmented burning: {str(e)}")
+        return None
+
+
 async def burn_subtitles(
     input_path: str,
     output_path: str,
@@ -10,7 +443,7 @@ async def burn_subtitles(
 ):
     """
     Burn subtitles permanently into video
-    
+
     Parameters:
     - input_path: Path to input video file
     - output_path: Path to output video with burned subtitles
@@ -20,64 +453,41 @@ async def burn_subtitles(
     - font_color: Font color (name or hex)
     - bg_color: Background color with opacity (e.g., "black@0.5")
     - position: "top", "middle", or "bottom"
-    
+
     Returns:
     - Path to output file if successful, None otherwise
     """
     try:
         if ms:
             await ms.edit("<i>Starting subtitle burn process...</i>")
-        
+
         if not os.path.exists(subtitle_path):
             if ms:
                 await ms.edit("<i>Subtitle file not found!</i>")
             return None
 
-        # Position mapping
-        position_map = {
-            "top": "(h-text_h)/10",
-            "middle": "(h-text_h)/2",
-            "bottom": "h-text_h-10"
-        }
-        pos_y = position_map.get(position.lower(), "h-text_h-10")
-
-        # FFmpeg filter for subtitles with styling
-        subtitle_filter = (
-            f"subtitles='{subtitle_path.replace(':', '\\:')}':"
-            f"force_style='Fontsize={font_size},"
-            f"PrimaryColour={font_color},"
-            f"BackColour={bg_color},"
-            f"Alignment=2,MarginV=20,"
-            f"Outline=1,Shadow=0'"
+        job = plan_ffmpeg_job(
+            input_path,
+            output_path,
+            burn_subtitles=[{
+                'path': subtitle_path,
+                'settings': {
+                    'font_size': font_size,
+                    'font_color': font_color,
+                    'bg_color': bg_color,
+                    'position': position
+                }
+            }]
         )
 
-        command = [
-            'ffmpeg', '-y', '-i', input_path,
-            '-vf', subtitle_filter,
-            '-c:a', 'copy',
-            '-c:v', 'libx264',  # Re-encode video
-            '-crf', '18',       # Good quality
-            '-preset', 'fast',
-            output_path
-        ]
-
         if ms:
             await ms.edit("<i>Burning subtitles into video...</i>")
 
-        process = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        stdout, stderr = await process.communicate()
-
-        if os.path.exists(output_path):
+        if await execute_job(job):
             if ms:
                 await ms.edit("<i>Subtitles burned successfully! ✅</i>")
             return output_path
         else:
-            error_msg = stderr.decode().strip()
-            print(f"Error burning subtitles: {error_msg}")
             if ms:
                 await ms.edit("<i>Failed to burn subtitles! ❌</i>")
             return None
@@ -0,0 +1,179 @@
+# Jishu Developer
+# Don't Remove Credit 🥺
+# Telegram Channel @JishuBotz
+# Developer @JishuDeveloper
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from config import Config
+
+
+# Eviction starts above the high watermark and frees space down to the low one
+HIGH_WATERMARK = 0.9
+LOW_WATERMARK = 0.7
+# Seconds an interrupted download is kept for a resume before it is deleted
+PART_TTL = 24 * 60 * 60
+
+
+class MediaCache:
+    """
+    LRU cache of downloaded source files on local disk, keyed by file_unique_id
+
+    Files in use are reference counted and never evicted, so a job can keep
+    reading its source while other downloads push the cache over budget.
+    Concurrent misses on the same key share a single download. Interrupted
+    downloads count against the budget, go first when space is needed and
+    are deleted after PART_TTL.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self.parts = OrderedDict()  # key -> (mtime, size) of its .part file, oldest first
+        self.refs = {}
+        self.total = 0
+        # In-flight downloads and how many fetches are waiting on each
+        self.downloads = {}
+        self.waiters = {}
+        os.makedirs(self.root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Index files left over from before a restart, oldest access first"""
+        files = []
+        parts = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith('.temp'):
+                # Unfinished download
+                os.remove(path)
+            elif name.endswith('.part'):
+                # Resumable download, picked up again by the next fetch
+                stat = os.stat(path)
+                parts.append((stat.st_mtime, name[:-len('.part')], stat.st_size))
+            elif os.path.isfile(path):
+                stat = os.stat(path)
+                files.append((stat.st_atime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total += size
+        for mtime, key, size in sorted(parts):
+            self.parts[key] = (mtime, size)
+            self.total += size
+        self.evict()
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def __contains__(self, key):
+        return key in self.entries or key in self.downloads
+
+    def acquire(self, key):
+        """Return the cached path of `key` and pin it, None on a miss"""
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        self.refs[key] = self.refs.get(key, 0) + 1
+        return self.path(key)
+
+    async def fetch(self, key, download):
+        """
+        Return the path of `key` pinned like acquire, awaiting `download(path)` on a miss
+        Returns None if the download failed
+        """
+        path = self.acquire(key)
+        if path is not None:
+            return path
+
+        future = self.downloads.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._download(key, download))
+            self.downloads[key] = future
+            self.waiters[key] = 0
+        self.waiters[key] += 1
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if future.done():
+                # Our pin was handed out just before the cancellation
+                if not future.cancelled() and future.exception() is None and future.result():
+                    self.release(key)
+            else:
+                self.waiters[key] -= 1
+                if not self.waiters[key]:
+                    future.cancel()
+            raise
+
+    async def _download(self, key, download):
+        # A leftover .part is resumed now, it is counted again if this one fails too
+        self.total -= self.parts.pop(key, (0, 0))[1]
+        try:
+            if not await download(self.path(key)):
+                self._keep_part(key)
+                return None
+            size = os.path.getsize(self.path(key))
+            self.total += size - self.entries.get(key, 0)
+            self.entries[key] = size
+            self.entries.move_to_end(key)
+            # One pin for every fetch that waited on this download
+            self.refs[key] = self.refs.get(key, 0) + self.waiters[key]
+            self.evict()
+            return self.path(key)
+        except BaseException:
+            self._keep_part(key)
+            raise
+        finally:
+            self.downloads.pop(key, None)
+            self.waiters.pop(key, None)
+
+    def _keep_part(self, key):
+        """Account for the .part file a failed or cancelled download left behind"""
+        try:
+            stat = os.stat(f"{self.path(key)}.part")
+        except FileNotFoundError:
+            return
+        self.parts[key] = (stat.st_mtime, stat.st_size)
+        self.total += stat.st_size
+        self.evict()
+
+    def release(self, key):
+        refs = self.refs.get(key, 0) - 1
+        if refs > 0:
+            self.refs[key] = refs
+        else:
+            self.refs.pop(key, None)
+        self.evict()
+
+    def _drop_part(self, key):
+        self.total -= self.parts.pop(key)[1]
+        try:
+            os.remove(f"{self.path(key)}.part")
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        expired = time.time() - PART_TTL
+        for key in [key for key, (mtime, _) in self.parts.items() if mtime < expired]:
+            self._drop_part(key)
+        if self.total <= self.max_bytes * HIGH_WATERMARK:
+            return
+        # Interrupted downloads go before finished files
+        for key in list(self.parts):
+            if self.total <= self.max_bytes * LOW_WATERMARK:
+                return
+            self._drop_part(key)
+        for key in list(self.entries):
+            if self.total <= self.max_bytes * LOW_WATERMARK:
+                break
+            if self.refs.get(key):
+                continue
+            self.total -= self.entries.pop(key)
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+
+media_cache = MediaCache(Config.MEDIA_CACHE_DIR, Config.MEDIA_CACHE_SIZE * 1024 * 1024)
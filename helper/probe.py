@@ -0,0 +1,125 @@
+# Jishu Developer
+# Don't Remove Credit 🥺
+# Telegram Channel @JishuBotz
+# Developer @JishuDeveloper
+import os
+import math
+import json
+from collections import OrderedDict
+from .database import jishubotz
+from .ffmpeg import run_command, job_timeout
+
+
+# Chunks (1 MiB each) fetched from the start and the end of a file for probing.
+# The tail covers MP4s with the moov atom at the end and the MKV cues/seek head.
+PROBE_HEAD_CHUNKS = 8
+PROBE_TAIL_CHUNKS = 4
+
+# Parsed probes kept in memory, Telegram files are also kept in Mongo
+PROBE_CACHE_SIZE = 2000
+
+probe_cache = OrderedDict()
+
+
+async def probe_file(file_path):
+    """Get media file information using ffprobe"""
+    command = [
+        'ffprobe', '-v', 'quiet',
+        '-print_format', 'json',
+        '-show_format', '-show_streams',
+        file_path
+    ]
+
+    try:
+        returncode, stdout, stderr = await run_command(command, timeout=job_timeout('probe'), job_class='probe')
+        return json.loads(stdout.decode())
+    except:
+        return {'streams': []}
+
+
+async def probe_message(client, message, file, temp_path):
+    """Probe media by fetching only its head and tail into a sparse file"""
+    chunk_size = 1024 * 1024
+    chunks = math.ceil(file.file_size / chunk_size)
+    try:
+        with open(temp_path, 'wb') as f:
+            # Keep the real size so ffprobe finds trailing atoms at their true offsets
+            f.truncate(file.file_size)
+            async for chunk in client.stream_media(message, limit=PROBE_HEAD_CHUNKS):
+                f.write(chunk)
+            if chunks > PROBE_HEAD_CHUNKS:
+                tail = min(PROBE_TAIL_CHUNKS, chunks - PROBE_HEAD_CHUNKS)
+                f.seek((chunks - tail) * chunk_size)
+                async for chunk in client.stream_media(message, offset=-tail):
+                    f.write(chunk)
+        return await probe_file(temp_path)
+    except Exception as e:
+        print(f"Partial probe failed: {str(e)}")
+        return {'streams': []}
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def compact_probe(probe):
+    """The parts of ffprobe's output the bot uses, a few hundred bytes per file"""
+    fmt = probe.get('format', {})
+    return {
+        'duration': float(fmt.get('duration', 0) or 0),
+        'format_name': fmt.get('format_name', ''),
+        'streams': [
+            {
+                'index': stream.get('index', i),
+                'codec_type': stream.get('codec_type'),
+                'codec_name': stream.get('codec_name'),
+                'language': stream.get('tags', {}).get('language'),
+                'width': stream.get('width', 0),
+                'height': stream.get('height', 0),
+                'duration': float(stream.get('duration', 0) or 0)
+            }
+            for i, stream in enumerate(probe.get('streams', []))
+        ]
+    }
+
+
+def remember(key, probe):
+    probe_cache[key] = probe
+    probe_cache.move_to_end(key)
+    if len(probe_cache) > PROBE_CACHE_SIZE:
+        probe_cache.popitem(last=False)
+
+
+def cached_probe(file_unique_id):
+    """A probe already done for this Telegram file in this process, None otherwise"""
+    probe = probe_cache.get(file_unique_id)
+    if probe is not None:
+        probe_cache.move_to_end(file_unique_id)
+    return probe
+
+
+async def probe_media(client, message, temp_path):
+    """
+    Compact probe of a Telegram file, at most one ffprobe per file across restarts
+    Only the head and tail are fetched, the whole file if that isn't enough
+    """
+    file = getattr(message, message.media.value)
+    key = file.file_unique_id
+    probe = cached_probe(key)
+    if probe is None:
+        probe = await jishubotz.get_probe(key)
+    if probe is None:
+        raw = await probe_message(client, message, file, temp_path)
+        if not raw.get('streams'):
+            # Partial probe failed, fall back to the whole file
+            path = await message.download(temp_path)
+            raw = await probe_file(path) if path else {'streams': []}
+            if path:
+                os.remove(path)
+        probe = compact_probe(raw)
+        if not probe['streams']:
+            # Likely a transient failure, the next send of this file probes again
+            return probe
+        await jishubotz.set_probe(key, probe)
+    remember(key, probe)
+    return probe
+
@@ -0,0 +1,191 @@
+# Jishu Developer
+# Don't Remove Credit 🥺
+# Telegram Channel @JishuBotz
+# Developer @JishuDeveloper
+import time
+import heapq
+import asyncio
+import itertools
+import contextvars
+from contextlib import contextmanager
+from pyrogram import raw
+from pyrogram.errors import FloodWait
+from config import Config
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every sender of a job
+
+    A FloodWait pauses all senders for the wait and halves the rate, which
+    then creeps back up towards `max_rate` with every successful send.
+    """
+
+    def __init__(self, rate, capacity=None, min_rate=1):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def penalize(self, seconds):
+        """Back off after a FloodWait of `seconds`"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0
+
+    def reward(self):
+        self.rate = min(self.max_rate, self.rate + 0.01 * self.max_rate)
+
+
+# Outbound priority classes, lower goes first
+INTERACTIVE = 0
+PROGRESS = 1
+LOG = 2
+BROADCAST = 3
+
+current_priority = contextvars.ContextVar('current_priority', default=INTERACTIVE)
+
+# Calls that post or edit messages, everything else isn't governed
+GOVERNED_QUERIES = (
+    raw.functions.messages.SendMessage,
+    raw.functions.messages.SendMedia,
+    raw.functions.messages.SendMultiMedia,
+    raw.functions.messages.EditMessage,
+    raw.functions.messages.ForwardMessages,
+)
+
+# Per-chat bursts before the chat rate applies, and chats tracked before idle ones are dropped
+CHAT_BURST = 3
+CHAT_LIMITERS_SIZE = 10000
+
+
+@contextmanager
+def outbound_priority(priority):
+    """Send API calls made inside the block with `priority`"""
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def peer_id(peer):
+    return getattr(peer, 'user_id', None) or getattr(peer, 'channel_id', None) or getattr(peer, 'chat_id', None)
+
+
+class EditSuperseded(Exception):
+    """A queued low priority edit was replaced by a newer edit of the same message"""
+
+
+class PriorityLimiter:
+    """A TokenBucket handing out tokens by priority, then in arrival order"""
+
+    def __init__(self, rate, capacity=None):
+        self.bucket = TokenBucket(rate, capacity)
+        self.queue = []
+        self.seq = itertools.count()
+        self.dispatcher = None
+
+    @property
+    def idle(self):
+        return not self.queue and (self.dispatcher is None or self.dispatcher.done())
+
+    async def acquire(self, priority):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queue, (priority, next(self.seq), future))
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self):
+        while True:
+            # Cancelled waiters are dropped here
+            while self.queue and self.queue[0][2].done():
+                heapq.heappop(self.queue)
+            if not self.queue:
+                return
+            await self.bucket.acquire()
+            while self.queue and self.queue[0][2].done():
+                heapq.heappop(self.queue)
+            if not self.queue:
+                self.bucket.tokens += 1
+                return
+            # Whoever is first now gets the token, a reply that came in meanwhile beats a progress edit
+            heapq.heappop(self.queue)[2].set_result(None)
+
+
+class OutboundGovernor:
+    """
+    Central limiter for messages the bot sends or edits
+
+    Every send passes a global and a per-chat limiter, both ordered by the
+    caller's priority class, so user-facing replies overtake progress edits,
+    logs and broadcasts when the bot is busy. A progress edit still waiting
+    for its turn is dropped once a newer edit of the same message is queued.
+    """
+
+    def __init__(self, rate, chat_rate):
+        self.limiter = PriorityLimiter(rate)
+        self.chat_rate = chat_rate
+        self.chats = {}
+        self.latest_edits = {}
+
+    def chat_limiter(self, chat_id):
+        limiter = self.chats.get(chat_id)
+        if limiter is None:
+            if len(self.chats) >= CHAT_LIMITERS_SIZE:
+                for key in [key for key, value in self.chats.items() if value.idle]:
+                    del self.chats[key]
+            limiter = self.chats[chat_id] = PriorityLimiter(self.chat_rate, capacity=CHAT_BURST)
+        return limiter
+
+    async def invoke(self, call, query, *args, **kwargs):
+        """Run `call(query, ...)` once the limiters let it through"""
+        if not isinstance(query, GOVERNED_QUERIES):
+            return await call(query, *args, **kwargs)
+
+        priority = current_priority.get()
+        chat_id = peer_id(getattr(query, 'peer', None) or getattr(query, 'to_peer', None))
+        edit_key = token = None
+        if isinstance(query, raw.functions.messages.EditMessage) and priority >= PROGRESS:
+            edit_key, token = (chat_id, query.id), object()
+            self.latest_edits[edit_key] = token
+        try:
+            await self.chat_limiter(chat_id).acquire(priority)
+            if edit_key and self.latest_edits.get(edit_key) is not token:
+                raise EditSuperseded
+            await self.limiter.acquire(priority)
+            if edit_key and self.latest_edits.get(edit_key) is not token:
+                raise EditSuperseded
+        finally:
+            if edit_key and self.latest_edits.get(edit_key) is token:
+                del self.latest_edits[edit_key]
+
+        try:
+            r = await call(query, *args, **kwargs)
+        except FloodWait as e:
+            self.chat_limiter(chat_id).bucket.penalize(e.value)
+            raise
+        self.chat_limiter(chat_id).bucket.reward()
+        return r
+
+
+governor = OutboundGovernor(Config.API_RATE, Config.CHAT_RATE)
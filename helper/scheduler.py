@@ -0,0 +1,165 @@
+# Jishu Developer
+# Don't Remove Credit 🥺
+# Telegram Channel @JishuBotz
+# Developer @JishuDeveloper
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from config import Config
+from .utils import TimeFormatter
+from .ratelimit import outbound_priority, PROGRESS
+
+
+CPU_COUNT = os.cpu_count() or 1
+
+# Seconds between checks of a waiting job's queue position
+QUEUE_UPDATE_INTERVAL = 5
+
+
+class JobPool:
+    """A fixed number of job slots with a FIFO queue of waiting jobs"""
+
+    def __init__(self, name, slots, avg_duration):
+        self.name = name
+        self.slots = max(1, slots)
+        self.active = 0
+        self.waiters = deque()
+        # Moving average of finished job durations in seconds, used for the ETA
+        self.avg_duration = avg_duration
+
+    def eta(self, position):
+        # Jobs ahead of us drain `slots` at a time
+        return math.ceil(position / self.slots) * self.avg_duration
+
+    async def acquire(self, on_wait=None):
+        if self.active < self.slots and not self.waiters:
+            self.active += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        last_position = None
+        try:
+            while not waiter.done():
+                position = self.waiters.index(waiter) + 1
+                if on_wait and position != last_position:
+                    last_position = position
+                    await on_wait(position, self.eta(position))
+                await asyncio.wait({waiter}, timeout=QUEUE_UPDATE_INTERVAL)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just before we got cancelled
+                self.release()
+            else:
+                waiter.cancel()
+                self.waiters.remove(waiter)
+            raise
+
+    def release(self, duration=None):
+        if duration is not None:
+            self.avg_duration += 0.2 * (duration - self.avg_duration)
+        # Hand the slot straight to the next waiter so nobody can jump the queue
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class JobScheduler:
+    """
+    Bounded pools for ffmpeg jobs
+
+    Stream-copy remuxes are mostly disk bound and get one slot per core,
+    re-encodes already spread over several cores each and get far fewer.
+    """
+
+    def __init__(self, remux_workers, encode_workers):
+        self.pools = {
+            'remux': JobPool('remux', remux_workers or CPU_COUNT, avg_duration=60),
+            'encode': JobPool('encode', encode_workers or CPU_COUNT // 4, avg_duration=600),
+        }
+        # Running jobs by (chat id, status message id) for the Cancel button
+        self.jobs = {}
+        self.cancelled = set()
+        # Cores parallel re-encodes use beyond their cores_per_encode share
+        self.extra_cores = 0
+
+    async def run_cancellable(self, ms, coro):
+        """
+        Run `coro` as its own task that the Cancel button on `ms` can stop
+        Returns the result of `coro`, None if it was cancelled
+        """
+        key = (ms.chat.id, ms.id)
+        task = asyncio.create_task(coro)
+        self.jobs[key] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if key not in self.cancelled:
+                raise
+            return None
+        finally:
+            self.jobs.pop(key, None)
+            self.cancelled.discard(key)
+
+    def cancel(self, chat_id, message_id):
+        """Cancel the job reporting to this status message, returns False if there is none"""
+        key = (chat_id, message_id)
+        task = self.jobs.get(key)
+        if task is None or task.done():
+            return False
+        self.cancelled.add(key)
+        task.cancel()
+        return True
+
+    @property
+    def cores_per_encode(self):
+        """Cores one re-encode may use without oversubscribing the box"""
+        return max(1, CPU_COUNT // self.pools['encode'].slots)
+
+    @contextmanager
+    def idle_cores(self):
+        """
+        Cores for a parallel re-encode that holds its encode slot: its share
+        plus whatever the other running re-encodes leave idle, which is every
+        core on an otherwise idle box. The extra cores stay claimed until exit.
+        """
+        others = self.pools['encode'].active - 1
+        cores = max(1, CPU_COUNT - others * self.cores_per_encode - self.extra_cores)
+        extra = max(0, cores - self.cores_per_encode)
+        self.extra_cores += extra
+        try:
+            yield cores
+        finally:
+            self.extra_cores -= extra
+
+    @asynccontextmanager
+    async def slot(self, kind, ms=None):
+        """Wait for a free slot in the `kind` pool, reporting the queue position on `ms`"""
+        pool = self.pools[kind]
+
+        async def on_wait(position, eta):
+            try:
+                with outbound_priority(PROGRESS):
+                    await ms.edit(
+                        f"⏳ <b>Queued</b>\n\n"
+                        f"Position : {position}\n"
+                        f"ETA : {TimeFormatter(milliseconds=eta * 1000) or '0 s'}"
+                    )
+            except:
+                pass
+
+        await pool.acquire(on_wait if ms else None)
+        start = time.time()
+        try:
+            yield
+        finally:
+            pool.release(time.time() - start)
+
+
+scheduler = JobScheduler(Config.REMUX_WORKERS, Config.ENCODE_WORKERS)
@@ -0,0 +1,196 @@
+# Jishu Developer
+# Don't Remove Credit 🥺
+# Telegram Channel @JishuBotz
+# Developer @JishuDeveloper
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timezone
+from config import Config
+from .database import jishubotz, SESSION_TTL
+
+
+# Subtitle menus left alone for SESSION_TTL are dropped along with their subtitle files,
+# the oldest ones go early once there are this many
+MAX_SESSIONS = 5000
+# Seconds between expiry sweeps and writes of changed sessions to Mongo
+SWEEP_INTERVAL = 30
+
+
+class SubtitleSession:
+    """One user's pending subtitle job, ids and file references only"""
+
+    __slots__ = (
+        'session_id', 'user_id', 'chat_id', 'message_id', 'filename', 'file_unique_id',
+        'existing_subs', 'bitmap_subs', 'duration', 'format_name', 'width', 'height',
+        'subtitles', 'burn_subtitles', 'subs_to_remove', 'burn_settings',
+        'awaiting_subtitle', 'last_used', 'running'
+    )
+
+    # Everything but the runtime flag is persisted
+    FIELDS = __slots__[:-1]
+
+    def __init__(self, session_id, user_id, chat_id, message_id, filename, file_unique_id,
+                 existing_subs, duration, format_name, width, height,
+                 subtitles=None, burn_subtitles=None, subs_to_remove=None, burn_settings=None,
+                 awaiting_subtitle=None, last_used=None, bitmap_subs=None):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.filename = filename
+        self.file_unique_id = file_unique_id
+        self.existing_subs = existing_subs
+        self.bitmap_subs = bitmap_subs or []  # Dropped on the way to MP4
+        self.duration = duration
+        self.format_name = format_name
+        self.width = width
+        self.height = height
+        self.subtitles = subtitles or []  # For soft subtitles
+        self.burn_subtitles = burn_subtitles or []  # For hardcoded subtitles
+        self.subs_to_remove = subs_to_remove or []
+        self.burn_settings = burn_settings or {
+            'font_size': 24,
+            'font_color': "white",
+            'bg_color': "black@0.5",
+            'position': "bottom"
+        }
+        self.awaiting_subtitle = awaiting_subtitle
+        self.last_used = last_used or time.time()
+        self.running = False
+
+    def to_doc(self):
+        doc = {name: getattr(self, name) for name in self.FIELDS}
+        doc['_id'] = self.user_id
+        # Date for the TTL index
+        doc['last_used'] = datetime.utcfromtimestamp(self.last_used)
+        return doc
+
+    @classmethod
+    def from_doc(cls, doc):
+        doc = {name: doc.get(name) for name in cls.FIELDS}
+        # Mongo hands back naive UTC datetimes
+        doc['last_used'] = doc['last_used'].replace(tzinfo=timezone.utc).timestamp() if doc['last_used'] else None
+        return cls(**doc)
+
+    def files(self):
+        return self.subtitles + [sub['path'] for sub in self.burn_subtitles]
+
+
+class SessionStore:
+    """
+    Bounded store of subtitle sessions, one per user
+
+    Idle sessions expire after SESSION_TTL and the oldest ones go once there
+    are MAX_SESSIONS, their downloaded subtitle files with them. With
+    PERSIST_SESSIONS, changes are written behind to Mongo so menus survive a
+    restart, and Mongo's TTL index expires abandoned ones there.
+    """
+
+    def __init__(self, collection=None):
+        self.sessions = OrderedDict()  # user id -> SubtitleSession, least recently used first
+        self.collection = collection
+        self.dirty = set()
+        self.evicted = set()  # user ids whose Mongo docs are deleted on the next sweep
+        self.sweeper = None
+
+    async def get(self, user_id):
+        session = self.sessions.get(user_id)
+        if session is None and self.collection is not None and user_id not in self.evicted:
+            doc = await self.collection.find_one({'_id': user_id})
+            if doc:
+                session = SubtitleSession.from_doc(doc)
+                self.sessions[user_id] = session
+                self.start_sweeper()
+        if session is None:
+            return None
+        if not session.running and time.time() - session.last_used > SESSION_TTL:
+            await self.remove(user_id)
+            return None
+        self.sessions.move_to_end(user_id)
+        return session
+
+    def put(self, session):
+        old = self.sessions.pop(session.user_id, None)
+        if old is not None and not old.running:
+            self.discard(old)
+        self.sessions[session.user_id] = session
+        self.touch(session)
+        while len(self.sessions) > MAX_SESSIONS:
+            user_id, oldest = next(iter(self.sessions.items()))
+            if oldest.running:
+                self.sessions.move_to_end(user_id)
+                break
+            # Not expired, its doc would bring it back with its files gone
+            self.drop(user_id)
+            if self.collection is not None:
+                self.evicted.add(user_id)
+        self.start_sweeper()
+
+    def touch(self, session):
+        """Mark `session` as used and changed, if it still is its user's session"""
+        session.last_used = time.time()
+        if self.sessions.get(session.user_id) is session:
+            self.sessions.move_to_end(session.user_id)
+            self.dirty.add(session.user_id)
+            self.evicted.discard(session.user_id)
+
+    def finish(self, session):
+        """End `session`'s job, its files go if a newer session replaced it meanwhile"""
+        session.running = False
+        if self.sessions.get(session.user_id) is session:
+            self.touch(session)
+        else:
+            self.discard(session)
+
+    async def remove(self, user_id):
+        self.drop(user_id)
+        if self.collection is not None:
+            await self.collection.delete_one({'_id': user_id})
+
+    def drop(self, user_id):
+        session = self.sessions.pop(user_id, None)
+        self.dirty.discard(user_id)
+        if session is not None:
+            self.discard(session)
+
+    def discard(self, session):
+        for path in session.files():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def start_sweeper(self):
+        if self.sweeper is None or self.sweeper.done():
+            self.sweeper = asyncio.create_task(self.run_sweeper())
+
+    async def run_sweeper(self):
+        while self.sessions:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"Error sweeping sessions: {e}")
+
+    async def sweep(self):
+        now = time.time()
+        expired = [
+            user_id for user_id, session in self.sessions.items()
+            if not session.running and now - session.last_used > SESSION_TTL
+        ]
+        for user_id in expired:
+            self.drop(user_id)
+        if self.collection is not None and self.evicted:
+            evicted, self.evicted = self.evicted, set()
+            await self.collection.delete_many({'_id': {'$in': list(evicted)}})
+        if self.collection is not None and self.dirty:
+            dirty, self.dirty = self.dirty, set()
+            for user_id in dirty:
+                session = self.sessions.get(user_id)
+                if session is not None:
+                    await self.collection.replace_one({'_id': user_id}, session.to_doc(), upsert=True)
+
+
+subtitle_sessions = SessionStore(jishubotz.sessions if Config.PERSIST_SESSIONS else None)
@@ -0,0 +1,108 @@
+# Jishu Developer
+# Don't Remove Credit 🥺
+# Telegram Channel @JishuBotz
+# Developer @JishuDeveloper
+import os
+from string import Formatter
+from functools import lru_cache
+from .utils import humanbytes, convert
+
+
+# Placeholders captions, prefixes and suffixes may use
+TEMPLATE_FIELDS = (
+    'filename', 'filesize', 'duration',
+    'resolution', 'quality', 'video_codec', 'audio_codec',
+    'audio_languages', 'subtitle_languages'
+)
+
+
+class TemplateError(ValueError):
+    """A template that can't be rendered, the message is shown to the user"""
+
+
+@lru_cache(maxsize=4096)
+def compile_template(text):
+    """
+    Parse a caption or rename template once into a render function
+
+    Only plain {field} or {field:spec} placeholders from TEMPLATE_FIELDS are
+    accepted, so a template can't reach attributes like {filename.__class__}.
+    Compiled templates are cached by their text, a new /set_caption or
+    /set_prefix simply compiles the new text on its first use.
+
+    Raises TemplateError if the template is invalid
+    """
+    try:
+        parsed = list(Formatter().parse(text))
+    except ValueError as e:
+        raise TemplateError(f"Invalid template: {e}")
+
+    pieces = []
+    for literal, field, spec, conversion in parsed:
+        if field is None:
+            pieces.append((literal, None, None))
+            continue
+        if field not in TEMPLATE_FIELDS:
+            raise TemplateError(f"Unknown field {{{field}}}, use one of: " + ", ".join(f"{{{f}}}" for f in TEMPLATE_FIELDS))
+        if conversion or '{' in spec:
+            raise TemplateError(f"Unsupported format for {{{field}}}")
+        try:
+            format('', spec)
+        except ValueError:
+            raise TemplateError(f"Invalid format spec for {{{field}}}: {spec}")
+        pieces.append((literal, field, spec))
+    pieces = tuple(pieces)
+
+    def render(fields):
+        return ''.join(
+            literal if field is None else literal + format(fields[field], spec)
+            for literal, field, spec in pieces
+        )
+
+    return render
+
+
+def template_fields(filename, filesize, duration, probe=None):
+    """Values for every field, computed once per job"""
+    streams = (probe or {}).get('streams', [])
+    video = next((s for s in streams if s['codec_type'] == 'video'), {})
+    audio = [s for s in streams if s['codec_type'] == 'audio']
+    subtitles = [s for s in streams if s['codec_type'] == 'subtitle']
+    return {
+        'filename': filename,
+        'filesize': humanbytes(filesize),
+        'duration': convert(duration),
+        'resolution': f"{video['width']}x{video['height']}" if video.get('width') else "",
+        'quality': f"{video['height']}p" if video.get('height') else "",
+        'video_codec': video.get('codec_name') or "",
+        'audio_codec': audio[0]['codec_name'] or "" if audio else "",
+        'audio_languages': ", ".join(s['language'] for s in audio if s.get('language')),
+        'subtitle_languages': ", ".join(s['language'] for s in subtitles if s.get('language'))
+    }
+
+
+def render_caption(caption, fields):
+    """Fill a user's custom caption, None if they have none"""
+    if not caption:
+        return None
+    try:
+        return compile_template(caption)(fields)
+    except TemplateError as e:
+        # Saved before templates were checked
+        print(f"Caption error: {e}")
+        return caption
+
+
+def render_filename(filename, prefix, suffix, fields):
+    """`filename` with the user's prefix and suffix templates around its name"""
+    if not filename or (not prefix and not suffix):
+        return filename
+    name, extension = os.path.splitext(filename)
+    try:
+        prefix = compile_template(prefix)(fields) if prefix else ""
+        suffix = f" {compile_template(suffix)(fields)}" if suffix else ""
+    except TemplateError as e:
+        print(f"Rename error: {e}")
+        return filename
+    # Never let a template add a path
+    return f"{prefix}{name}{suffix}{extension}".replace('/', '_')
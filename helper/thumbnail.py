@@ -0,0 +1,175 @@
+# Jishu Developer
+# Don't Remove Credit 🥺
+# Telegram Channel @JishuBotz
+# Developer @JishuDeveloper
+import os
+import time
+import asyncio
+from PIL import Image
+from pyrogram.file_id import FileId, FileUniqueId, FileUniqueType
+from config import Config
+from .ffmpeg import run_command, job_timeout
+
+
+# Telegram wants video thumbnails as JPEG of at most 320px a side
+THUMB_SIZE = 320
+THUMB_QUALITY = 85
+# Where in the video auto-thumbnail candidates are taken, as fractions of the duration
+SCREENSHOT_POSITIONS = (0.1, 0.25, 0.5, 0.75)
+# Cached thumbnails kept at most, least recently used go first, and idle ones expire
+MAX_THUMBS = 5000
+THUMB_TTL = 30 * 24 * 60 * 60
+# Seconds between prunes of the thumbnail cache
+PRUNE_INTERVAL = 10 * 60
+
+os.makedirs(Config.THUMB_CACHE_DIR, exist_ok=True)
+
+# Normalizations in progress by file_unique_id, concurrent jobs share them
+pending_thumbs = {}
+last_prune = 0
+
+
+def cached_thumbnail(path):
+    """`path` if it is in the thumbnail cache, marked as just used"""
+    try:
+        os.utime(path)
+        return path
+    except FileNotFoundError:
+        return None
+
+
+def prune_thumbnails():
+    """Keep the MAX_THUMBS most recently used thumbnails that haven't expired"""
+    global last_prune
+    now = time.time()
+    if now - last_prune < PRUNE_INTERVAL:
+        return
+    last_prune = now
+    thumbs = []
+    for entry in os.scandir(Config.THUMB_CACHE_DIR):
+        # Downloads and screenshot candidates in progress are left alone
+        if entry.name.endswith('.jpg') and '.jpg.' not in entry.name:
+            thumbs.append((entry.stat().st_mtime, entry.path))
+    thumbs.sort(reverse=True)
+    for i, (mtime, path) in enumerate(thumbs):
+        if i >= MAX_THUMBS or now - mtime > THUMB_TTL:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def normalize_thumbnail(source, dest):
+    """
+    Convert an image to an RGB JPEG of at most THUMB_SIZE a side
+    Blocking, run it in an executor
+    Returns (width, height) of the result
+    """
+    with Image.open(source) as img:
+        img = img.convert("RGB")
+        img.thumbnail((THUMB_SIZE, THUMB_SIZE))
+        temp = f"{dest}.temp"
+        img.save(temp, "JPEG", quality=THUMB_QUALITY)
+    os.replace(temp, dest)
+    return img.size
+
+
+async def fix_thumb(thumb):
+    """Normalize `thumb` in place off the event loop, returns width, height and the path or None"""
+    try:
+        width, height = await asyncio.get_running_loop().run_in_executor(None, normalize_thumbnail, thumb, thumb)
+        return width, height, thumb
+    except Exception as e:
+        print(f"Error processing thumbnail: {e}")
+        return 0, 0, None
+
+
+def thumb_unique_id(file_id):
+    """file_unique_id of a photo or document file_id, without asking Telegram"""
+    return FileUniqueId(
+        file_unique_type=FileUniqueType.DOCUMENT,
+        media_id=FileId.decode(file_id).media_id
+    ).encode()
+
+
+async def user_thumbnail(client, file_id):
+    """
+    Local path of a user's thumbnail ready for upload, None if it can't be used
+    Downloaded and normalized once per thumbnail, later jobs reuse the JPEG
+    """
+    if not file_id:
+        return None
+    try:
+        key = thumb_unique_id(file_id)
+        path = os.path.join(os.path.abspath(Config.THUMB_CACHE_DIR), f"{key}.jpg")
+        if cached_thumbnail(path):
+            return path
+
+        task = pending_thumbs.get(key)
+        if task is None:
+            task = pending_thumbs[key] = asyncio.ensure_future(prepare_thumbnail(client, file_id, path))
+            task.add_done_callback(lambda _: pending_thumbs.pop(key, None))
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Error preparing thumbnail: {e}")
+        return None
+
+
+async def prepare_thumbnail(client, file_id, path):
+    raw_path = f"{path}.download"
+    try:
+        if not await client.download_media(file_id, file_name=raw_path):
+            return None
+        _, _, thumb = await fix_thumb(raw_path)
+        if thumb is None:
+            return None
+        os.replace(raw_path, path)
+        prune_thumbnails()
+        return path
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+
+
+async def auto_thumbnail(video_path, file_unique_id, duration):
+    """
+    Thumbnail taken from the video itself, cached per source file
+    Returns its path, None if ffmpeg couldn't get a frame
+    """
+    path = os.path.join(os.path.abspath(Config.THUMB_CACHE_DIR), f"auto_{file_unique_id}.jpg")
+    if cached_thumbnail(path):
+        return path
+
+    # One ffmpeg run decodes a single keyframe near each position, already scaled down
+    positions = [duration * p for p in SCREENSHOT_POSITIONS] if duration else [0]
+    candidates = [f"{path}.{i}.jpg" for i in range(len(positions))]
+    command = ['ffmpeg', '-y']
+    for position in positions:
+        command += ['-skip_frame', 'nokey', '-ss', f"{position:.3f}", '-i', video_path]
+    for i, candidate in enumerate(candidates):
+        command += [
+            '-map', f"{i}:v:0",
+            '-frames:v', '1',
+            '-vf', f"scale={THUMB_SIZE}:{THUMB_SIZE}:force_original_aspect_ratio=decrease",
+            '-q:v', '3',
+            candidate
+        ]
+    try:
+        returncode, _, error = await run_command(command, timeout=job_timeout('probe'), job_class='probe')
+        if returncode != 0:
+            print(f"Error taking screenshots: {error}")
+        # The largest JPEG has the most detail, which skips black and fade frames
+        frames = [c for c in candidates if os.path.exists(c) and os.path.getsize(c)]
+        if not frames:
+            return None
+        os.replace(max(frames, key=os.path.getsize), path)
+        prune_thumbnails()
+        return path
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        for candidate in candidates:
+            if os.path.exists(candidate):
+                os.remove(candidate)
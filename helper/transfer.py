@@ -0,0 +1,435 @@
+# Jishu Developer
+# Don't Remove Credit 🥺
+# Telegram Channel @JishuBotz
+# Developer @JishuDeveloper
+import os
+import math
+import time
+import asyncio
+from pyrogram import raw, types, utils
+from pyrogram.errors import AuthBytesInvalid, FilePartMissing, FloodWait
+from pyrogram.file_id import FileId
+from pyrogram.session import Auth, Session
+from config import Config
+
+
+# Telegram's upload part size
+PART_SIZE = 512 * 1024
+# stream_media chunk size, offsets are counted in these
+CHUNK_SIZE = 1024 * 1024
+# Attempts per download or upload part before giving up
+TRANSFER_RETRIES = 5
+# Files up to this size must be uploaded with SaveFilePart instead
+BIG_FILE_SIZE = 10 * 1024 * 1024
+# Requests kept in flight per media connection, like save_file does
+WORKERS_PER_SESSION = 4
+
+
+class SessionPool:
+    """
+    Media sessions of one client, several per DC
+
+    pyrogram keeps a single media session per DC for downloads, spreading
+    a big transfer over a few connections gets it much closer to the uplink.
+    """
+
+    def __init__(self, client, size):
+        self.client = client
+        self.size = max(1, size)
+        self.sessions = {}
+        self.lock = asyncio.Lock()
+
+    async def get(self, dc_id=None):
+        """Started sessions for `dc_id`, the client's home DC by default"""
+        if dc_id is None:
+            dc_id = await self.client.storage.dc_id()
+        async with self.lock:
+            if dc_id not in self.sessions:
+                self.sessions[dc_id] = [await self._start(dc_id) for _ in range(self.size)]
+        return self.sessions[dc_id]
+
+    async def _start(self, dc_id):
+        # Same as Client.get_file: other DCs need a fresh key and an imported authorization
+        test_mode = await self.client.storage.test_mode()
+        if dc_id == await self.client.storage.dc_id():
+            session = Session(self.client, dc_id, await self.client.storage.auth_key(), test_mode, is_media=True)
+            await session.start()
+            return session
+
+        session = Session(
+            self.client, dc_id, await Auth(self.client, dc_id, test_mode).create(),
+            test_mode, is_media=True
+        )
+        await session.start()
+        for _ in range(3):
+            exported_auth = await self.client.invoke(raw.functions.auth.ExportAuthorization(dc_id=dc_id))
+            try:
+                await session.invoke(
+                    raw.functions.auth.ImportAuthorization(id=exported_auth.id, bytes=exported_auth.bytes)
+                )
+            except AuthBytesInvalid:
+                continue
+            return session
+        await session.stop()
+        raise AuthBytesInvalid
+
+    async def stop(self):
+        for sessions in self.sessions.values():
+            for session in sessions:
+                await session.stop()
+        self.sessions.clear()
+
+
+session_pools = {}
+
+
+def session_pool(client):
+    """The SessionPool of `client`, created on first use"""
+    if client not in session_pools:
+        session_pools[client] = SessionPool(client, Config.TRANSFER_CONNECTIONS)
+    return session_pools[client]
+
+
+async def stop_session_pools():
+    for pool in session_pools.values():
+        await pool.stop()
+    session_pools.clear()
+
+
+def report_bandwidth(action, name, size, start, connections):
+    elapsed = max(time.time() - start, 0.001)
+    print(f"{action} {name}: {size / 1048576:.1f} MB in {elapsed:.1f}s, "
+          f"{size / 1048576 / elapsed:.2f} MB/s over {connections} connection(s)")
+
+
+async def save_big_part(session, file_id, part, total_parts, chunk, retries=TRANSFER_RETRIES):
+    """Upload one SaveBigFilePart, retrying with backoff, returns False if it kept failing"""
+    for attempt in range(retries):
+        try:
+            await session.invoke(
+                raw.functions.upload.SaveBigFilePart(
+                    file_id=file_id,
+                    file_part=part,
+                    file_total_parts=total_parts,
+                    bytes=chunk
+                )
+            )
+            return True
+        except FloodWait as e:
+            await asyncio.sleep(e.value)
+        except Exception as e:
+            print(f"Error uploading part {part}: {e}")
+            await asyncio.sleep(2 ** attempt)
+    return False
+
+
+async def download_resumable(client, message, path, progress=None, progress_args=(), retries=TRANSFER_RETRIES):
+    """
+    Download the media of `message` to `path`, resuming after errors
+
+    Chunks are appended to `path`.part, whose size is the resume offset, so a
+    retry or a restart continues with stream_media from the last whole chunk
+    instead of starting over.
+
+    Returns path, None if it kept failing
+    """
+    file_size = getattr(message, message.media.value).file_size
+    if Config.TRANSFER_CONNECTIONS and file_size > BIG_FILE_SIZE:
+        try:
+            if await download_parallel(client, message, path, progress, progress_args):
+                return path
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Parallel download of {path} failed, falling back to one connection: {e}")
+
+    part_path = f"{path}.part"
+    for attempt in range(retries):
+        # Only whole chunks count, a torn last write is fetched again
+        done = os.path.getsize(part_path) // CHUNK_SIZE if os.path.exists(part_path) else 0
+        try:
+            with open(part_path, 'ab') as f:
+                f.truncate(done * CHUNK_SIZE)
+                current = done * CHUNK_SIZE
+                # stream_media logs and stops on network errors instead of raising
+                async for chunk in client.stream_media(message, offset=done):
+                    f.write(chunk)
+                    current += len(chunk)
+                    if progress:
+                        await progress(current, file_size, *progress_args)
+        except FloodWait as e:
+            await asyncio.sleep(e.value)
+            continue
+        except Exception as e:
+            print(f"Error downloading {path}: {e}")
+        if os.path.getsize(part_path) >= file_size:
+            os.replace(part_path, path)
+            return path
+        await asyncio.sleep(2 ** attempt)
+    return None
+
+
+async def download_parallel(client, message, path, progress=None, progress_args=()):
+    """
+    Download the media of `message` to `path` over several media connections
+
+    Workers take the next 1 MiB chunk from a shared counter and write it at
+    its offset, so a slow connection doesn't hold back the others. Failed
+    chunks are retried on their own.
+
+    Returns path, None if some chunk kept failing
+    """
+    file = getattr(message, message.media.value)
+    file_id = FileId.decode(file.file_id)
+    location = raw.types.InputDocumentFileLocation(
+        id=file_id.media_id,
+        access_hash=file_id.access_hash,
+        file_reference=file_id.file_reference,
+        thumb_size=file_id.thumbnail_size
+    )
+    sessions = await session_pool(client).get(file_id.dc_id)
+    total_chunks = math.ceil(file.file_size / CHUNK_SIZE)
+    temp_path = f"{path}.temp"
+    next_chunk = 0
+    current = 0
+    start = time.time()
+
+    async def get_chunk(session, index):
+        for attempt in range(TRANSFER_RETRIES):
+            try:
+                r = await session.invoke(
+                    raw.functions.upload.GetFile(location=location, offset=index * CHUNK_SIZE, limit=CHUNK_SIZE),
+                    sleep_threshold=30
+                )
+            except FloodWait as e:
+                await asyncio.sleep(e.value)
+                continue
+            except Exception as e:
+                print(f"Error downloading chunk {index}: {e}")
+                await asyncio.sleep(2 ** attempt)
+                continue
+            if not isinstance(r, raw.types.upload.File):
+                # CDN redirects are left to stream_media
+                raise ValueError(f"Unexpected GetFile result {type(r).__name__}")
+            return r.bytes
+        return None
+
+    async def worker(session, fd):
+        nonlocal next_chunk, current
+        while next_chunk < total_chunks:
+            index = next_chunk
+            next_chunk += 1
+            chunk = await get_chunk(session, index)
+            if chunk is None:
+                raise ConnectionError(f"Chunk {index} kept failing")
+            os.pwrite(fd, chunk, index * CHUNK_SIZE)
+            current += len(chunk)
+            if progress:
+                await progress(current, file.file_size, *progress_args)
+
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    workers = []
+    try:
+        os.ftruncate(fd, file.file_size)
+        workers = [
+            asyncio.create_task(worker(session, fd))
+            for session in sessions
+            for _ in range(WORKERS_PER_SESSION)
+        ]
+        await asyncio.gather(*workers)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    finally:
+        # One failed chunk stops the rest
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        os.close(fd)
+    os.replace(temp_path, path)
+    report_bandwidth("Downloaded", os.path.basename(path), file.file_size, start, len(sessions))
+    return path
+
+
+async def upload_resumable(client, path, file_name, progress=None, progress_args=()):
+    """
+    Upload a big file with part-level retries instead of restarting the whole upload
+    Parts are spread over the client's media connections to the home DC
+    Returns the InputFileBig, None if some part kept failing
+    """
+    file_size = os.path.getsize(path)
+    total_parts = math.ceil(file_size / PART_SIZE)
+    file_id = client.rnd_id()
+    sessions = await session_pool(client).get()
+    queue = list(range(total_parts - 1, -1, -1))
+    current = 0
+    failed = False
+    start = time.time()
+
+    async def worker(session):
+        nonlocal current, failed
+        with open(path, 'rb') as f:
+            while queue and not failed:
+                part = queue.pop()
+                f.seek(part * PART_SIZE)
+                chunk = f.read(PART_SIZE)
+                if not await save_big_part(session, file_id, part, total_parts, chunk):
+                    failed = True
+                    return
+                current += len(chunk)
+                if progress:
+                    await progress(current, file_size, *progress_args)
+
+    await asyncio.gather(*(worker(session) for session in sessions for _ in range(WORKERS_PER_SESSION)))
+    if failed:
+        return None
+    report_bandwidth("Uploaded", file_name, file_size, start, len(sessions))
+    return raw.types.InputFileBig(id=file_id, parts=total_parts, name=file_name)
+
+
+class StreamUploader:
+    """
+    Upload a file to Telegram part by part while it is still being written
+
+    Parts go out as SaveBigFilePart with an unknown (-1) part count until
+    the last one, so a file can be uploaded while ffmpeg still produces it.
+    Slow uploads push back on the writer through the bounded worker count.
+    """
+
+    def __init__(self, client, workers=WORKERS_PER_SESSION * max(1, Config.TRANSFER_CONNECTIONS)):
+        self.client = client
+        self.file_id = client.rnd_id()
+        self.buffer = bytearray()
+        self.parts = 0
+        self.size = 0
+        self.failed = False
+        self.semaphore = asyncio.Semaphore(workers)
+        self.pending = set()
+
+    async def write(self, data):
+        self.buffer += data
+        self.size += len(data)
+        # Always keep some data back, the last part must carry the part count
+        while len(self.buffer) > PART_SIZE:
+            chunk = bytes(self.buffer[:PART_SIZE])
+            del self.buffer[:PART_SIZE]
+            await self._send(chunk, -1)
+
+    async def _send(self, chunk, total_parts):
+        part = self.parts
+        self.parts += 1
+        await self.semaphore.acquire()
+        task = asyncio.create_task(self._save_part(part, total_parts, chunk))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def _save_part(self, part, total_parts, chunk):
+        try:
+            sessions = await session_pool(self.client).get()
+            session = sessions[part % len(sessions)]
+            if not await save_big_part(session, self.file_id, part, total_parts, chunk):
+                self.failed = True
+        finally:
+            self.semaphore.release()
+
+    async def finish(self, file_name):
+        """
+        Send the last part
+        Returns the uploaded InputFileBig, None if the stream upload can't be used
+        """
+        if self.size <= BIG_FILE_SIZE:
+            # Too small for a big file, the caller uploads it the normal way
+            await asyncio.gather(*self.pending, return_exceptions=True)
+            return None
+        await self._send(bytes(self.buffer), self.parts + 1)
+        self.buffer.clear()
+        await asyncio.gather(*self.pending, return_exceptions=True)
+        if self.failed:
+            return None
+        return raw.types.InputFileBig(id=self.file_id, parts=self.parts, name=file_name)
+
+    def abort(self):
+        for task in list(self.pending):
+            task.cancel()
+
+
+async def send_uploaded_video(
+    client,
+    chat_id,
+    file,
+    path: str,
+    file_name: str,
+    caption: str = None,
+    duration: float = 0,
+    width: int = 0,
+    height: int = 0,
+    thumb: str = None
+):
+    """
+    Send a video whose parts were already uploaded, like send_video does after save_file
+    Parts Telegram reports missing are uploaded again from `path`
+    """
+    media = raw.types.InputMediaUploadedDocument(
+        # `path` may be an extensionless cache entry, the name tells the real type
+        mime_type=client.guess_mime_type(file_name) or "video/mp4",
+        file=file,
+        thumb=await client.save_file(thumb) if thumb else None,
+        attributes=[
+            raw.types.DocumentAttributeVideo(
+                supports_streaming=True,
+                duration=int(duration),
+                w=width,
+                h=height
+            ),
+            raw.types.DocumentAttributeFilename(file_name=file_name)
+        ]
+    )
+    while True:
+        try:
+            r = await client.invoke(
+                raw.functions.messages.SendMedia(
+                    peer=await client.resolve_peer(chat_id),
+                    media=media,
+                    random_id=client.rnd_id(),
+                    **await utils.parse_text_entities(client, caption or "", None, None)
+                )
+            )
+        except FilePartMissing as e:
+            await client.save_file(path, file_id=file.id, file_part=e.value)
+        else:
+            for i in r.updates:
+                if isinstance(i, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+                    return await types.Message._parse(
+                        client, i.message,
+                        {u.id: u for u in r.users},
+                        {c.id: c for c in r.chats}
+                    )
+
+
+async def send_video_resumable(
+    client,
+    chat_id,
+    path: str,
+    file_name: str,
+    caption: str = None,
+    duration: float = 0,
+    width: int = 0,
+    height: int = 0,
+    thumb: str = None,
+    progress=None,
+    progress_args=()
+):
+    """
+    send_video with part-level upload retries for big files
+    Small files are cheap to resend and are uploaded with save_file as usual
+    """
+    if os.path.getsize(path) > BIG_FILE_SIZE:
+        file = await upload_resumable(client, path, file_name, progress, progress_args)
+        if file is None:
+            raise ConnectionError("Upload kept failing")
+    else:
+        file = await client.save_file(path, progress=progress, progress_args=progress_args)
+    return await send_uploaded_video(
+        client, chat_id, file, path, file_name,
+        caption=caption, duration=duration, width=width, height=height, thumb=thumb
+    )
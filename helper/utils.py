@@ -1,41 +1,135 @@
-import math, time, re, os
+import math, time, os
 from datetime import datetime
 from pytz import timezone
 from config import Config, Txt 
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from pyrogram.errors import FloodWait, MessageIdInvalid, MessageNotModified
+from .ratelimit import outbound_priority, EditSuperseded, PROGRESS, LOG
 
 
-async def progress_for_pyrogram(current, total, ud_type, message, start):
-    now = time.time()
-    diff = now - start
-    if round(diff % 5.00) == 0 or current == total:        
-        percentage = current * 100 / total
-        speed = current / diff
-        elapsed_time = round(diff) * 1000
-        time_to_completion = round((total - current) / speed) * 1000
-        estimated_total_time = elapsed_time + time_to_completion
-
-        elapsed_time = TimeFormatter(milliseconds=elapsed_time)
-        estimated_total_time = TimeFormatter(milliseconds=estimated_total_time)
-
-        progress = "{0}{1}".format(
-            ''.join(["▣" for i in range(math.floor(percentage / 5))]),
-            ''.join(["▢" for i in range(20 - math.floor(percentage / 5))])
-        )            
-        tmp = progress + Txt.PROGRESS_BAR.format( 
+# Seconds between edits of a status message, and weight of the newest speed sample
+PROGRESS_INTERVAL = 5
+SPEED_SMOOTHING = 0.3
+# Reporters of status messages not updated for this long are dropped
+REPORTER_TTL = 10 * 60
+
+PROGRESS_BARS = ["▣" * i + "▢" * (20 - i) for i in range(21)]
+CANCEL_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("✖️ 𝖢𝖺𝗇𝖼𝖾𝗅 ✖️", callback_data="close")]])
+
+
+class ProgressReporter:
+    """
+    Progress bar on one status message
+
+    Edits at most every PROGRESS_INTERVAL seconds and only when the text
+    changed, with speed and ETA smoothed over the samples in between.
+    """
+
+    def __init__(self, message):
+        self.message = message
+        self.phase = None
+        self.last_edit = 0
+        self.last_text = None
+        self.last_used = time.time()
+        self.disabled = False
+
+    def start_phase(self, phase):
+        if phase != self.phase:
+            self.phase = phase
+            self.speed = None
+            self.sample = None
+
+    def smooth(self, speed):
+        self.speed = speed if self.speed is None else self.speed + SPEED_SMOOTHING * (speed - self.speed)
+        return self.speed
+
+    async def transfer(self, current, total, ud_type, start):
+        self.start_phase((ud_type, start))
+        now = time.time()
+        # Speed from samples at least a second apart, transfers report every chunk
+        if self.sample is None:
+            self.sample = (now, current)
+        elif now - self.sample[0] >= 1 or current >= total:
+            self.smooth((current - self.sample[1]) / max(now - self.sample[0], 0.001))
+            self.sample = (now, current)
+        if not self.due(now, current >= total):
+            return
+        speed = self.speed or 0
+        percentage = current * 100 / total if total else 100
+        time_to_completion = round((total - current) / speed) * 1000 if speed else 0
+        estimated_total_time = TimeFormatter(milliseconds=round(now - start) * 1000 + time_to_completion)
+        tmp = PROGRESS_BARS[min(math.floor(percentage / 5), 20)] + Txt.PROGRESS_BAR.format(
             round(percentage, 2),
             humanbytes(current),
             humanbytes(total),
-            humanbytes(speed),            
+            humanbytes(speed),
             estimated_total_time if estimated_total_time != '' else "0 s"
         )
+        await self.edit(f"{ud_type}\n\n{tmp}", now)
+
+    async def encode(self, current, total, speed, ud_type, start):
+        """Encode progress in seconds of media, `speed` being ffmpeg's realtime factor"""
+        self.start_phase((ud_type, start))
+        now = time.time()
+        speed = self.smooth(speed)
+        if not self.due(now, current >= total):
+            return
+        percentage = min(current * 100 / total, 100)
+        time_to_completion = round((total - current) / speed) * 1000 if speed else 0
+        estimated_total_time = TimeFormatter(milliseconds=round(now - start) * 1000 + time_to_completion)
+        tmp = PROGRESS_BARS[math.floor(percentage / 5)] + Txt.ENCODE_BAR.format(
+            round(percentage, 2),
+            TimeFormatter(milliseconds=current * 1000) or "0 s",
+            TimeFormatter(milliseconds=total * 1000),
+            round(speed, 2),
+            estimated_total_time if estimated_total_time != '' else "0 s"
+        )
+        await self.edit(f"{ud_type}\n\n{tmp}", now)
+
+    def due(self, now, finished):
+        self.last_used = now
+        return not self.disabled and (finished or now - self.last_edit >= PROGRESS_INTERVAL)
+
+    async def edit(self, text, now):
+        if text == self.last_text:
+            return
+        self.last_edit = now
+        self.last_text = text
         try:
-            await message.edit(
-                text=f"{ud_type}\n\n{tmp}",               
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("✖️ 𝖢𝖺𝗇𝖼𝖾𝗅 ✖️", callback_data="close")]])                                               
-            )
-        except:
+            with outbound_priority(PROGRESS):
+                await self.message.edit(text=text, reply_markup=CANCEL_MARKUP)
+        except (EditSuperseded, MessageNotModified):
             pass
+        except FloodWait as e:
+            # No progress edits until the wait is over
+            self.last_edit = now + e.value
+        except MessageIdInvalid:
+            self.disabled = True
+        except Exception as e:
+            print(f"Error editing progress: {e}")
+
+
+progress_reporters = {}
+
+
+def progress_reporter(message):
+    """The ProgressReporter of a status message, shared by every stage of a job"""
+    key = (message.chat.id, message.id)
+    reporter = progress_reporters.get(key)
+    if reporter is None:
+        now = time.time()
+        for stale in [k for k, r in progress_reporters.items() if now - r.last_used > REPORTER_TTL]:
+            del progress_reporters[stale]
+        reporter = progress_reporters[key] = ProgressReporter(message)
+    return reporter
+
+
+async def progress_for_pyrogram(current, total, ud_type, message, start):
+    await progress_reporter(message).transfer(current, total, ud_type, start)
+
+async def progress_for_ffmpeg(current, total, speed, ud_type, message, start):
+    """Show encode progress (in seconds of media) the same way as transfers"""
+    await progress_reporter(message).encode(current, total, speed, ud_type, start)
 
 def humanbytes(size):    
     if not size:
@@ -74,37 +168,15 @@ async def send_log(b, u):
         curr = datetime.now(timezone("Asia/Kolkata"))
         date = curr.strftime('%d %B, %Y')
         time = curr.strftime('%I:%M:%S %p')
-        await b.send_message(
-            Config.LOG_CHANNEL,
-            f"<b><u>𝖭𝖾𝗐 𝖴𝗌𝖾𝗋 𝖲𝗍𝖺𝗋𝗍𝖾𝖽 𝖳𝗁𝖾 𝖡𝗈𝗍</u></b> \n\n<b>𝖴𝗌𝖾𝗋 𝖬𝖾𝗇𝗍𝗂𝗈𝗇</b> : {u.mention}\n<b>𝖴𝗌𝖾𝗋 𝖨𝖣</b> : `{u.id}`\n<b>𝖥𝗂𝗋𝗌𝗍 𝖭𝖺𝗆𝖾</b> : {u.first_name} \n<b>𝖫𝖺𝗌𝗍 𝖭𝖺𝗆𝖾</b> : {u.last_name} \n<b>𝖴𝗌𝖾𝗋 𝖭𝖺𝗆𝖾</b> : @{u.username} \n<b>𝖴𝗌𝖾𝗋 𝖫𝗂𝗇𝗄</b> : <a href='tg://openmessage?user_id={u.id}'>𝖢𝗅𝗂𝖼𝗄 𝖧𝖾𝗋𝖾</a>\n\n<b>𝖣𝖺𝗍𝖾</b> : {date}\n<b>𝖳𝗂𝗆𝖾</b> : {time}"
-        )
+        with outbound_priority(LOG):
+            await b.send_message(
+                Config.LOG_CHANNEL,
+                f"<b><u>𝖭𝖾𝗐 𝖴𝗌𝖾𝗋 𝖲𝗍𝖺𝗋𝗍𝖾𝖽 𝖳𝗁𝖾 𝖡𝗈𝗍</u></b> \n\n<b>𝖴𝗌𝖾𝗋 𝖬𝖾𝗇𝗍𝗂𝗈𝗇</b> : {u.mention}\n<b>𝖴𝗌𝖾𝗋 𝖨𝖣</b> : `{u.id}`\n<b>𝖥𝗂𝗋𝗌𝗍 𝖭𝖺𝗆𝖾</b> : {u.first_name} \n<b>𝖫𝖺𝗌𝗍 𝖭𝖺𝗆𝖾</b> : {u.last_name} \n<b>𝖴𝗌𝖾𝗋 𝖭𝖺𝗆𝖾</b> : @{u.username} \n<b>𝖴𝗌𝖾𝗋 𝖫𝗂𝗇𝗄</b> : <a href='tg://openmessage?user_id={u.id}'>𝖢𝗅𝗂𝖼𝗄 𝖧𝖾𝗋𝖾</a>\n\n<b>𝖣𝖺𝗍𝖾</b> : {date}\n<b>𝖳𝗂𝗆𝖾</b> : {time}"
+            )
         
 
 
 
-def add_prefix_suffix(input_string, prefix='', suffix=''):
-    pattern = r'(?P<filename>.*?)(\.\w+)?$'
-    match = re.search(pattern, input_string)
-    if match:
-        filename = match.group('filename')
-        extension = match.group(2) or ''
-        if prefix == None:
-            if suffix == None:
-                return f"{filename}{extension}"
-            return f"{filename} {suffix}{extension}"
-        elif suffix == None:
-            if prefix == None:
-               return f"{filename}{extension}"
-            return f"{prefix}{filename}{extension}"
-        else:
-            return f"{prefix}{filename} {suffix}{extension}"
-
-
-    else:
-        return input_string
-
-
-
 def makedir(name: str):
     """
     Create a directory with the specified name.
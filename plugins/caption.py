@@ -1,11 +1,16 @@
 from pyrogram import Client, filters 
 from helper.database import jishubotz
+from helper.template import compile_template, TemplateError
 
 @Client.on_message(filters.private & filters.command(['set_caption', "sc"]))
 async def add_caption(client, message):
     if len(message.command) == 1:
        return await message.reply_text("**Give The Caption\n\nExample :- `/set_caption 📕Name ➠ : {filename} \n\n🔗 Size ➠ : {filesize} \n\n⏰ Duration ➠ : {duration}`**")
     caption = message.text.split(" ", 1)[1]
+    try:
+        compile_template(caption)
+    except TemplateError as e:
+        return await message.reply_text(f"**{e} ❌**")
     await jishubotz.set_caption(message.from_user.id, caption=caption)
     await message.reply_text("**Your Caption Successfully Added ✅**")
    
@@ -1,202 +1,63 @@
 import os
+import shutil
 import time
 import json
 import uuid
+import hashlib
 import asyncio
-from PIL import Image
 from pyrogram import Client, filters
 from pyrogram.enums import MessageMediaType
+from pyrogram.errors import FloodWait
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message
-from hachoir.metadata import extractMetadata
-from hachoir.parser import createParser
+from config import Config
+from helper.database import jishubotz
+from helper.ffmpeg import plan_ffmpeg_job, needs_ffmpeg, execute_job, burn_segmented, run_command, job_timeout, SEGMENT_MIN_DURATION, BITMAP_SUBTITLE_CODECS
+from helper.scheduler import scheduler, CPU_COUNT
+from helper.media_cache import media_cache
+from helper.transfer import StreamUploader, send_uploaded_video, download_resumable, send_video_resumable
+from helper.client_pool import client_pool
+from helper.utils import progress_for_pyrogram
+from helper.sessions import SubtitleSession, subtitle_sessions
+from helper.thumbnail import user_thumbnail, auto_thumbnail
+from helper.probe import probe_media, cached_probe
+from helper.template import template_fields, render_caption, render_filename
 
 # Bot setup
 app = Client("my_bot")
 
-# Dictionary to store user sessions
-user_sessions = {}
-
-async def probe_file(file_path):
-    """Get media file information using ffprobe"""
-    command = [
-        'ffprobe', '-v', 'quiet',
-        '-print_format', 'json',
-        '-show_format', '-show_streams',
-        file_path
-    ]
-    
-    process = await asyncio.create_subprocess_exec(
-        *command,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    stdout, stderr = await process.communicate()
-    try:
-        return json.loads(stdout.decode())
-    except:
-        return {'streams': []}
+def file_digest(path):
+    """SHA-256 of a small local file such as an uploaded subtitle"""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
 
-async def fix_thumb(thumb):
-    width = 0
-    height = 0
-    try:
-        if thumb is not None:
-            parser = createParser(thumb)
-            metadata = extractMetadata(parser)
-            if metadata.has("width"):
-                width = metadata.get("width")
-            if metadata.has("height"):
-                height = metadata.get("height")
-                
-            with Image.open(thumb) as img:
-                img.convert("RGB").save(thumb)
-                if width > 320 or height > 320:
-                    ratio = min(320/width, 320/height)
-                    width = int(width * ratio)
-                    height = int(height * ratio)
-                    img = img.resize((width, height))
-                img.save(thumb, "JPEG")
-            parser.close()
-    except Exception as e:
-        print(e)
-        thumb = None 
-    return width, height, thumb
-    
-async def take_screen_shot(video_file, output_directory, ttl):
-    out_put_file_name = f"{output_directory}/{time.time()}.jpg"
-    file_genertor_command = [
-        "ffmpeg",
-        "-ss",
-        str(ttl),
-        "-i",
-        video_file,
-        "-vframes",
-        "1",
-        "-q:v",
-        "2",
-        out_put_file_name
-    ]
-    process = await asyncio.create_subprocess_exec(
-        *file_genertor_command,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    stdout, stderr = await process.communicate()
-    if os.path.lexists(out_put_file_name):
-        return out_put_file_name
-    return None
+def media_file_name(client, file, media):
+    """The file's name, made up from its type and id for media sent without one"""
+    if file.file_name:
+        return file.file_name
+    extension = client.guess_extension(file.mime_type) if file.mime_type else None
+    return f"{media.value}_{file.file_unique_id}{extension or ''}"
 
-async def remove_subtitles(input_path, output_path, sub_indices):
-    """Remove specified subtitle tracks from video"""
+def result_cache_key(session_data, file_name, metadata_code, thumb_id):
+    """Hash of everything that determines the uploaded output of a job, None if it can't be worked out"""
     try:
-        probe = await probe_file(input_path)
-        if not probe:
-            return None
-            
-        stream_mapping = []
-        for i, stream in enumerate(probe.get('streams', [])):
-            if stream.get('codec_type') == 'subtitle' and i in sub_indices:
-                continue
-            stream_mapping.extend(['-map', f'0:{i}'])
-        
-        command = [
-            'ffmpeg', '-y', '-i', input_path,
-            *stream_mapping,
-            '-c', 'copy',
-            output_path
+        subtitles = [file_digest(sub) for sub in session_data.subtitles]
+        burn_subtitles = [
+            {'subtitle': file_digest(sub['path']), 'settings': sub['settings']}
+            for sub in session_data.burn_subtitles
         ]
-        
-        process = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        await process.communicate()
-        return output_path if os.path.exists(output_path) else None
-    except Exception as e:
-        print(f"Error removing subtitles: {str(e)}")
-        return None
-
-async def add_subtitle(video_path, subtitle_path, output_path):
-    """Add subtitle to video file"""
-    try:
-        command = [
-            'ffmpeg', '-y', '-i', video_path, '-i', subtitle_path,
-            '-map', '0', '-map', '1',
-            '-c:v', 'copy', '-c:a', 'copy',
-            '-c:s', 'mov_text',
-            '-metadata:s:s:0', 'language=eng',
-            output_path
-        ]
-        
-        process = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        await process.communicate()
-        return output_path if os.path.exists(output_path) else None
-    except Exception as e:
-        print(f"Error adding subtitle: {str(e)}")
-        return None
-
-async def burn_subtitles(
-    input_path: str,
-    output_path: str,
-    subtitle_path: str,
-    font_size: int = 24,
-    font_color: str = "white",
-    bg_color: str = "black@0.5",
-    position: str = "bottom"
-):
-    """
-    Burn subtitles permanently into video
-    Returns output path if successful, None otherwise
-    """
-    try:
-        if not os.path.exists(subtitle_path):
-            return None
-
-        # Position mapping
-        position_map = {
-            "top": "(h-text_h)/10",
-            "middle": "(h-text_h)/2",
-            "bottom": "h-text_h-10"
-        }
-        pos_y = position_map.get(position.lower(), "h-text_h-10")
-
-        # FFmpeg filter for subtitles with styling
-        subtitle_filter = (
-            f"subtitles='{subtitle_path.replace(':', '\\:')}':"
-            f"force_style='Fontsize={font_size},"
-            f"PrimaryColour={font_color},"
-            f"BackColour={bg_color},"
-            f"Alignment=2,MarginV=20,"
-            f"Outline=1,Shadow=0'"
-        )
-
-        command = [
-            'ffmpeg', '-y', '-i', input_path,
-            '-vf', subtitle_filter,
-            '-c:a', 'copy',
-            '-c:v', 'libx264',
-            '-crf', '18',
-            '-preset', 'fast',
-            output_path
-        ]
-
-        process = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        await process.communicate()
-
-        return output_path if os.path.exists(output_path) else None
-
-    except Exception as e:
-        print(f"Error burning subtitles: {str(e)}")
+    except OSError as e:
+        print(f"Error hashing subtitles: {e}")
         return None
+    operation = {
+        'source': session_data.file_unique_id,
+        'filename': file_name,
+        'subs_to_remove': sorted(session_data.subs_to_remove),
+        'subtitles': subtitles,
+        'burn_subtitles': burn_subtitles,
+        'metadata': metadata_code,
+        'thumbnail': thumb_id
+    }
+    return hashlib.sha256(json.dumps(operation, sort_keys=True).encode()).hexdigest()
 
 @app.on_message(filters.private & (filters.document | filters.audio | filters.video))
 async def handle_file_upload(client, message: Message):
@@ -205,45 +66,50 @@ async def handle_file_upload(client, message: Message):
         return await message.reply_text("File too large (max 2GB)")
 
     session_id = str(uuid.uuid4())
-    temp_path = f"temp_{session_id}_{file.file_name}"
-    await message.download(temp_path)
+    file_name = media_file_name(client, file, message.media)
+    # Sending the same file again doesn't probe it again, even after a restart
+    probe = await probe_media(client, message, f"temp_{session_id}_{file_name}")
     
     existing_subs = []
-    probe = await probe_file(temp_path)
-    for i, stream in enumerate(probe.get('streams', [])):
-        if stream.get('codec_type') == 'subtitle':
-            existing_subs.append(i)
-    os.remove(temp_path)
+    bitmap_subs = []
+    video_stream = {}
+    for stream in probe['streams']:
+        if stream['codec_type'] == 'subtitle':
+            existing_subs.append(stream['index'])
+            if stream['codec_name'] in BITMAP_SUBTITLE_CODECS:
+                bitmap_subs.append(stream['index'])
+        elif stream['codec_type'] == 'video' and not video_stream:
+            video_stream = stream
     
-    user_sessions[message.from_user.id] = {
-        'session_id': session_id,
-        'message_id': message.id,
-        'filename': file.file_name,
-        'original_message': message,
-        'subtitles': [],  # For soft subtitles
-        'burn_subtitles': [],  # For hardcoded subtitles
-        'existing_subs': existing_subs,
-        'subs_to_remove': [],
-        'burn_settings': {
-            'font_size': 24,
-            'font_color': "white",
-            'bg_color': "black@0.5",
-            'position': "bottom"
-        }
-    }
+    subtitle_sessions.put(SubtitleSession(
+        session_id=session_id,
+        user_id=message.from_user.id,
+        chat_id=message.chat.id,
+        message_id=message.id,
+        filename=file_name,
+        file_unique_id=file.file_unique_id,
+        existing_subs=existing_subs,
+        bitmap_subs=bitmap_subs,
+        duration=probe['duration'],
+        format_name=probe['format_name'],
+        width=video_stream.get('width', 0),
+        height=video_stream.get('height', 0)
+    ))
 
-    await show_subtitle_options(message.from_user.id, session_id)
+    await show_subtitle_options(client, message.from_user.id, session_id)
 
-async def show_subtitle_options(user_id, session_id):
-    session_data = user_sessions[user_id]
+async def show_subtitle_options(client, user_id, session_id):
+    session_data = await subtitle_sessions.get(user_id)
+    if session_data is None:
+        return
     buttons = []
     
-    if session_data['existing_subs']:
+    if session_data.existing_subs:
         buttons.append([InlineKeyboardButton("📜 Existing Subtitles", callback_data="ignore")])
-        for sub_idx in session_data['existing_subs']:
+        for sub_idx in session_data.existing_subs:
             buttons.append([
                 InlineKeyboardButton(
-                    f"✅ Remove Track {sub_idx}" if sub_idx in session_data['subs_to_remove'] else f"❌ Remove Track {sub_idx}",
+                    f"✅ Remove Track {sub_idx}" if sub_idx in session_data.subs_to_remove else f"❌ Remove Track {sub_idx}",
                     callback_data=f"toggle_sub_{session_id}_{sub_idx}"
                 )
             ])
@@ -257,16 +123,18 @@ async def show_subtitle_options(user_id, session_id):
     ])
     
     text = "🔠 <b>Subtitle Management</b>\n\n"
-    if session_data['existing_subs']:
-        text += f"Found {len(session_data['existing_subs'])} subtitle tracks\n"
-    if session_data['subtitles']:
-        text += f"{len(session_data['subtitles'])} soft subtitles to add\n"
-    if session_data['burn_subtitles']:
-        text += f"{len(session_data['burn_subtitles'])} subtitles to burn\n"
+    if session_data.existing_subs:
+        text += f"Found {len(session_data.existing_subs)} subtitle tracks\n"
+    if session_data.subtitles:
+        text += f"{len(session_data.subtitles)} soft subtitles to add\n"
+    if session_data.burn_subtitles:
+        text += f"{len(session_data.burn_subtitles)} subtitles to burn\n"
     text += "Select options below:"
     
-    await session_data['original_message'].reply_text(
+    await client.send_message(
+        session_data.chat_id,
         text,
+        reply_to_message_id=session_data.message_id,
         reply_markup=InlineKeyboardMarkup(buttons)
     )
 
@@ -275,10 +143,10 @@ async def handle_burn_subtitle(bot, update):
     user_id = update.from_user.id
     session_id = update.data.split('_')[-1]
     
-    if user_id not in user_sessions or user_sessions[user_id]['session_id'] != session_id:
+    session_data = await subtitle_sessions.get(user_id)
+    if session_data is None or session_data.session_id != session_id:
         return await update.answer("Session expired")
     
-    session_data = user_sessions[user_id]
     await update.message.edit_text(
         "📌 <b>Send me the subtitle file to burn (.srt, .ass, etc.)</b>\n\n"
         "Note: Burned subtitles will be permanently embedded in the video.",
@@ -287,94 +155,314 @@ async def handle_burn_subtitle(bot, update):
         ])
     )
     
-    session_data['awaiting_subtitle'] = 'burn'
+    session_data.awaiting_subtitle = 'burn'
+    subtitle_sessions.touch(session_data)
 
 @app.on_message(filters.private & filters.document & filters.regex(r'\.(srt|ass|ssa)$'))
 async def handle_subtitle_upload(client, message: Message):
     user_id = message.from_user.id
-    if user_id not in user_sessions or 'awaiting_subtitle' not in user_sessions[user_id]:
+    session_data = await subtitle_sessions.get(user_id)
+    if session_data is None or session_data.awaiting_subtitle is None:
         return
     
-    session_data = user_sessions[user_id]
-    sub_path = f"subs_{session_data['session_id']}_{message.document.file_name}"
-    await message.download(sub_path)
+    # pyrogram puts relative names under downloads/, keep the path it actually used
+    sub_path = await message.download(f"subs_{session_data.session_id}_{message.document.file_name}")
+    if not sub_path:
+        return await message.reply_text("❌ Couldn't download the subtitle, send it again")
     
-    if session_data['awaiting_subtitle'] == 'burn':
-        session_data['burn_subtitles'].append({
+    if session_data.awaiting_subtitle == 'burn':
+        session_data.burn_subtitles.append({
             'path': sub_path,
-            'settings': session_data['burn_settings']
+            'settings': session_data.burn_settings
         })
         await message.reply_text(
             f"✅ Subtitle will be burned into video with current settings:\n"
-            f"Font: {session_data['burn_settings']['font_size']}px\n"
-            f"Color: {session_data['burn_settings']['font_color']}\n"
-            f"Position: {session_data['burn_settings']['position']}"
+            f"Font: {session_data.burn_settings['font_size']}px\n"
+            f"Color: {session_data.burn_settings['font_color']}\n"
+            f"Position: {session_data.burn_settings['position']}"
         )
     else:
-        session_data['subtitles'].append(sub_path)
+        session_data.subtitles.append(sub_path)
         await message.reply_text("✅ Subtitle will be added as soft subtitle")
     
-    del session_data['awaiting_subtitle']
-    await show_subtitle_options(user_id, session_data['session_id'])
+    session_data.awaiting_subtitle = None
+    subtitle_sessions.touch(session_data)
+    await show_subtitle_options(client, user_id, session_data.session_id)
 
 async def process_and_upload(bot, user_id, original_message):
-    if user_id not in user_sessions:
+    session_data = await subtitle_sessions.get(user_id)
+    if session_data is None:
         return
     
-    session_data = user_sessions[user_id]
-    file_path = f"downloads/{user_id}_{session_data['session_id'][:8]}/{session_data['filename']}"
+    file_path = f"downloads/{user_id}_{session_data.session_id[:8]}/{session_data.filename}"
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
     
     ms = await original_message.reply("Downloading...")
+    # Keeps the subtitle files from expiring under the running job
+    session_data.running = True
     try:
-        await original_message.download(file_path)
+        # The Cancel button stops the download, ffmpeg or upload wherever it is
+        await scheduler.run_cancellable(ms, run_job(bot, user_id, original_message, session_data, file_path, ms))
+    finally:
+        shutil.rmtree(os.path.dirname(file_path), ignore_errors=True)
+        subtitle_sessions.finish(session_data)
+
+async def run_job(bot, user_id, original_message, session_data, file_path, ms):
+    settings = await jishubotz.get_settings(user_id)
+    metadata_code = settings.metadata_code if settings.metadata else None
+
+    file = getattr(original_message, original_message.media.value)
+    # Fields are worked out once, the templates were compiled when first used
+    probe = cached_probe(session_data.file_unique_id) or await jishubotz.get_probe(session_data.file_unique_id)
+    fields = template_fields(session_data.filename, file.file_size, session_data.duration, probe)
+    caption = render_caption(settings.caption, fields)
+    file_name = render_filename(session_data.filename, settings.prefix, settings.suffix, fields)
+
+    # Nothing changes the bytes, the name or the thumbnail and the source already is a video: resend it by file_id
+    if (
+        original_message.media == MessageMediaType.VIDEO
+        and file_name == session_data.filename
+        and not settings.file_id
+        and not needs_ffmpeg(
+            session_data.subs_to_remove,
+            session_data.subtitles,
+            session_data.burn_subtitles,
+            metadata_code
+        )
+    ):
+        await bot.send_cached_media(chat_id=user_id, file_id=file.file_id, caption=caption)
+        await ms.delete()
+        return
+
+    # The same source with the same settings was already processed and uploaded
+    cache_key = result_cache_key(session_data, file_name, metadata_code, settings.file_id)
+    cached_file_id = await jishubotz.get_cached_file(cache_key) if cache_key else None
+    if cached_file_id:
+        try:
+            await bot.send_cached_media(chat_id=user_id, file_id=cached_file_id, caption=caption)
+            await ms.delete()
+            return
+        except Exception as e:
+            print(f"Stale cached file {cache_key}: {e}")
+            await jishubotz.delete_cached_file(cache_key)
+
+    # Normalized once per thumbnail and reused from the local cache
+    thumb = await user_thumbnail(bot, settings.file_id)
+
+    # Stream-copy jobs on sources ffmpeg can read from a pipe overlap all three stages
+    source_key = session_data.file_unique_id
+    if (
+        Config.PIPELINE_REMUX
+        and not session_data.burn_subtitles
+        and needs_ffmpeg(session_data.subs_to_remove, session_data.subtitles, session_data.burn_subtitles, metadata_code)
+        and 'matroska' in session_data.format_name
+        and source_key not in media_cache
+    ):
+        sent = await pipelined_remux(bot, user_id, original_message, session_data, file_path, ms, metadata_code, caption, file_name, thumb)
+        if sent:
+            if cache_key:
+                await jishubotz.set_cached_file(cache_key, getattr(sent, sent.media.value).file_id)
+            await ms.delete()
+            return
+
+    # Retries and repeated edits of the same source are served from local disk,
+    # users sending the same file at once share a single download
+    try:
+        source_path = await media_cache.fetch(
+            source_key,
+            lambda path: download_resumable(
+                bot, original_message, path,
+                progress=progress_for_pyrogram,
+                progress_args=("Downloading...", ms, time.time())
+            )
+        )
     except Exception as e:
         await ms.edit(f"Download failed: {e}")
         return
-    
-    # Process subtitle removal
-    if session_data['subs_to_remove']:
-        new_path = f"{file_path}_no_subs.mp4"
-        if await remove_subtitles(file_path, new_path, session_data['subs_to_remove']):
-            os.remove(file_path)
-            file_path = new_path
-    
-    # Process soft subtitles
-    for sub in session_data['subtitles']:
-        new_path = f"{file_path}_with_sub.mp4"
-        if await add_subtitle(file_path, sub, new_path):
-            os.remove(file_path)
-            file_path = new_path
-    
-    # Process burned subtitles
-    for sub in session_data['burn_subtitles']:
-        new_path = f"{file_path}_burned.mp4"
-        if await burn_subtitles(
-            file_path,
-            new_path,
-            sub['path'],
-            font_size=sub['settings']['font_size'],
-            font_color=sub['settings']['font_color'],
-            bg_color=sub['settings']['bg_color'],
-            position=sub['settings']['position']
-        ):
-            os.remove(file_path)
-            file_path = new_path
-    
+    if not source_path:
+        await ms.edit("Download failed")
+        return
+
+    try:
+        await process_source(bot, user_id, session_data, source_path, file_path, ms, metadata_code, caption, file_name, cache_key, thumb)
+    finally:
+        media_cache.release(source_key)
+
+async def pipelined_remux(bot, user_id, original_message, session_data, file_path, ms, metadata_code, caption, file_name, thumb):
+    """
+    Run a stream-copy job with download, ffmpeg and upload overlapping
+
+    The source is streamed from Telegram into ffmpeg's stdin and the fragmented
+    MP4 it writes is uploaded part by part while it is produced. A copy is kept
+    on disk for re-sending missing parts or a normal upload if the streamed one
+    can't be used.
+
+    Returns the sent message, None if the job has to go through the staged path
+    """
+    output_path = f"{file_path}_processed.mp4"
+    upload_name = f"{os.path.splitext(file_name)[0]}.mp4"
+    job = plan_ffmpeg_job(
+        'pipe:0',
+        'pipe:1',
+        existing_subs=session_data.existing_subs,
+        bitmap_subs=session_data.bitmap_subs,
+        subs_to_remove=session_data.subs_to_remove,
+        subtitles=session_data.subtitles,
+        metadata_code=metadata_code,
+        fragmented=True
+    )
+    if job is None:
+        return None
+    start = time.time()
+    try:
+        async with client_pool.acquire() as upload_client:
+            return await pipelined_upload(
+                bot, upload_client, user_id, original_message, session_data,
+                ms, caption, thumb, job, output_path, upload_name, start
+            )
+    except FloodWait as e:
+        # The pool now skips this client, the staged path picks another one
+        print(f"Pipelined upload hit a FloodWait of {e.value}s")
+        return None
+
+async def pipelined_upload(bot, upload_client, user_id, original_message, session_data, ms, caption, thumb, job, output_path, upload_name, start):
+    """The body of pipelined_remux, uploading with `upload_client` from the client pool"""
+    file = getattr(original_message, original_message.media.value)
+    chat_id = client_pool.target(upload_client, user_id)
+    uploader = StreamUploader(upload_client)
+
+    async def source():
+        done = 0
+        async for chunk in bot.stream_media(original_message):
+            done += len(chunk)
+            await progress_for_pyrogram(done, file.file_size, "Processing...", ms, start)
+            yield chunk
+        # stream_media stops quietly on network errors, and ffmpeg would happily
+        # finish a truncated MP4 from a truncated Matroska
+        if done < file.file_size:
+            raise ConnectionError(f"source stream ended at {done} of {file.file_size} bytes")
+
+    try:
+        with open(output_path, 'wb') as output:
+            async def on_output(chunk):
+                output.write(chunk)
+                await uploader.write(chunk)
+
+            async with scheduler.slot('remux', ms):
+                await ms.edit("Processing...")
+                returncode, _, error = await run_command(
+                    job.command,
+                    timeout=job_timeout('remux', session_data.duration),
+                    stdin=source(),
+                    on_output=on_output
+                )
+    except asyncio.TimeoutError:
+        returncode, error = None, "timed out"
+    except ConnectionError as e:
+        returncode, error = None, str(e)
+    except BaseException:
+        uploader.abort()
+        raise
+    if returncode != 0:
+        print(f"Pipelined remux failed: {error}")
+        uploader.abort()
+        return None
+
+    await ms.edit("Uploading...")
+    input_file = await uploader.finish(upload_name)
+    try:
+        if input_file:
+            sent = await send_uploaded_video(
+                upload_client, chat_id, input_file, output_path, upload_name,
+                caption=caption,
+                duration=session_data.duration,
+                width=session_data.width,
+                height=session_data.height,
+                thumb=thumb
+            )
+        else:
+            sent = await send_video_resumable(
+                upload_client, chat_id, output_path, upload_name,
+                caption=caption,
+                duration=session_data.duration,
+                width=session_data.width,
+                height=session_data.height,
+                thumb=thumb,
+                progress=progress_for_pyrogram,
+                progress_args=("Uploading...", ms, time.time())
+            )
+        return await client_pool.deliver(upload_client, user_id, sent)
+    except FloodWait:
+        raise
+    except Exception as e:
+        print(f"Pipelined upload failed: {e}")
+        return None
+
+async def process_source(bot, user_id, session_data, source_path, file_path, ms, metadata_code, caption, file_name, cache_key, thumb):
+    # The cached source is shared, everything written here stays under file_path's directory
+    upload_path = source_path
+    upload_name = file_name
+    if thumb is None and session_data.width:
+        thumb = await auto_thumbnail(source_path, session_data.file_unique_id, session_data.duration)
+
+    # Long videos are burned in parallel segments, one per idle core, the final pass then only remuxes
+    burned_video = None
+    segments_dir = f"{file_path}_segments"
+    if session_data.burn_subtitles and CPU_COUNT > 1 and session_data.duration >= SEGMENT_MIN_DURATION:
+        async with scheduler.slot('encode', ms):
+            # Counted once the slot is ours, other encodes may have started meanwhile
+            with scheduler.idle_cores() as workers:
+                await ms.edit("Burning subtitles...")
+                burned_video = await burn_segmented(
+                    source_path,
+                    segments_dir,
+                    session_data.burn_subtitles,
+                    session_data.duration,
+                    workers,
+                    ms
+                )
+
+    # Subtitle removal, soft subtitles, burns and metadata in a single pass
+    job = plan_ffmpeg_job(
+        source_path,
+        f"{file_path}_processed.mp4",
+        existing_subs=session_data.existing_subs,
+        bitmap_subs=session_data.bitmap_subs,
+        subs_to_remove=session_data.subs_to_remove,
+        subtitles=session_data.subtitles,
+        burn_subtitles=session_data.burn_subtitles,
+        metadata_code=metadata_code,
+        burned_video=burned_video
+    )
+    if job:
+        async with scheduler.slot('encode' if job.reencode else 'remux', ms):
+            await ms.edit("Processing...")
+            if not await execute_job(job, ms, session_data.duration):
+                # Never upload, let alone cache, the untouched source as the result
+                await ms.edit("Processing failed")
+                return
+            upload_path = job.output_path
+            upload_name = f"{os.path.splitext(upload_name)[0]}.mp4"
+
     # Upload the final file
     await ms.edit("Uploading...")
     try:
-        await bot.send_video(
-            chat_id=user_id,
-            video=file_path,
+        # Helper bots take the upload when configured, big uploads retry failed parts
+        sent = await client_pool.send_video(
+            user_id, upload_path, upload_name,
+            caption=caption,
+            duration=session_data.duration,
+            width=session_data.width,
+            height=session_data.height,
+            thumb=thumb,
             progress=progress_for_pyrogram,
             progress_args=("Uploading...", ms, time.time())
         )
     except Exception as e:
         await ms.edit(f"Upload failed: {e}")
-    finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+    else:
+        if cache_key:
+            await jishubotz.set_cached_file(cache_key, getattr(sent, sent.media.value).file_id)
         await ms.delete()
 
 app.run()
@@ -1,3 +1,4 @@
+import time
 from pyrogram import Client, filters, enums 
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from pyrogram.errors import UserNotParticipant
@@ -5,35 +6,68 @@ from config import Config
 from helper.database import jishubotz
 
 
+# Membership lookups are cached, members for longer than users who still have to join
+MEMBER_TTL = 10 * 60
+NOT_MEMBER_TTL = 60
+MEMBERSHIP_CACHE_SIZE = 50000
+
+# user id -> (expires, status), status is a ChatMemberStatus or None when not a participant
+membership = {}
+
+# Statuses that don't count as subscribed
+NOT_SUBSCRIBED = (None, enums.ChatMemberStatus.BANNED, enums.ChatMemberStatus.LEFT)
+
+
+async def get_membership(client, user_id):
+    cached = membership.get(user_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    try:
+        status = (await client.get_chat_member(Config.FORCE_SUB, user_id)).status
+    except UserNotParticipant:
+        status = None
+    set_membership(user_id, status)
+    return status
+
+
+def set_membership(user_id, status):
+    if len(membership) >= MEMBERSHIP_CACHE_SIZE:
+        now = time.monotonic()
+        for key in [key for key, (expires, _) in membership.items() if expires <= now]:
+            del membership[key]
+        if len(membership) >= MEMBERSHIP_CACHE_SIZE:
+            membership.clear()
+    subscribed = status not in NOT_SUBSCRIBED
+    membership[user_id] = (time.monotonic() + (MEMBER_TTL if subscribed else NOT_MEMBER_TTL), status)
+
 
 async def not_subscribed(_, client, message):
     await jishubotz.add_user(client, message)
     if not Config.FORCE_SUB:
         return False
-    try:             
-        user = await client.get_chat_member(Config.FORCE_SUB, message.from_user.id) 
-        if user.status == enums.ChatMemberStatus.BANNED:
-            return True 
-        else:
-            return False                
-    except UserNotParticipant:
-        pass
-    return True
+    status = await get_membership(client, message.from_user.id)
+    return status in NOT_SUBSCRIBED
 
 
 @Client.on_message(filters.private & filters.create(not_subscribed))
 async def forces_sub(client, message):
     buttons = [[InlineKeyboardButton(text="📢 Join Update Channel 📢", url=f"https://t.me/{Config.FORCE_SUB}") ]]
     text = f"""<b>Hello {message.from_user.mention} \n\nYou Need To Join In My Channel To Use Me\n\nKindly Please Join Channel</b>"""
-    try:
-        user = await client.get_chat_member(Config.FORCE_SUB, message.from_user.id)    
-        if user.status == enums.ChatMemberStatus.BANNED:                                   
-            return await client.send_message(message.from_user.id, text="Sorry You Are Banned To Use Me")  
-    except UserNotParticipant:                       
-        return await message.reply_text(text=text,quote=True, reply_markup=InlineKeyboardMarkup(buttons))
+    # The filter just looked the user up, this is served from the cache
+    if await get_membership(client, message.from_user.id) == enums.ChatMemberStatus.BANNED:
+        return await client.send_message(message.from_user.id, text="Sorry You Are Banned To Use Me")  
     return await message.reply_text(text=text,quote=True, reply_markup=InlineKeyboardMarkup(buttons))
 
 
+if Config.FORCE_SUB:
+    @Client.on_chat_member_updated(filters.chat(Config.FORCE_SUB))
+    async def membership_updated(client, update):
+        # Joins, leaves and bans show up right away, needs the bot to be an admin there
+        member = update.new_chat_member or update.old_chat_member
+        if member and member.user:
+            set_membership(member.user.id, update.new_chat_member.status if update.new_chat_member else None)
+
+
 
 
 
@@ -16,10 +16,10 @@ OFF = [[InlineKeyboardButton('Metadata Off ❌', callback_data='metadata_0')], [
 async def handle_metadata(bot: Client, message: Message):
 
     ms = await message.reply_text("**Please Wait...**", reply_to_message_id=message.id)
-    bool_metadata = await jishubotz.get_metadata(message.from_user.id)
-    user_metadata = await jishubotz.get_metadata_code(message.from_user.id)
+    settings = await jishubotz.get_settings(message.from_user.id)
+    user_metadata = settings.metadata_code
     await ms.delete()
-    if bool_metadata:
+    if settings.metadata:
         return await message.reply_text(f"**Your Current Metadata :-**\n\n➜ `{user_metadata}` ",quote=True, reply_markup=InlineKeyboardMarkup(ON))
     return await message.reply_text(f"**Your Current Metadata :-**\n\n➜ `{user_metadata}` ",quote=True, reply_markup=InlineKeyboardMarkup(OFF))
 
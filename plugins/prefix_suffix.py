@@ -1,5 +1,6 @@
 from pyrogram import Client, filters, enums
 from helper.database import jishubotz
+from helper.template import compile_template, TemplateError
 
 
 @Client.on_message(filters.private & filters.command('set_prefix'))
@@ -8,6 +9,10 @@ async def add_caption(client, message):
     if len(message.command) == 1:
         return await message.reply_text("**__Give The Prefix__\n\nExample:- `/set_prefix @Madflix_Bots`**")
     prefix = message.text.split(" ", 1)[1]
+    try:
+        compile_template(prefix)
+    except TemplateError as e:
+        return await message.reply_text(f"**{e} ❌**")
     JishuDeveloper = await message.reply_text("Please Wait ...")
     await jishubotz.set_prefix(message.from_user.id, prefix)
     await JishuDeveloper.edit("**Prefix Saved Successfully ✅**")
@@ -42,6 +47,10 @@ async def add_csuffix(client, message):
     if len(message.command) == 1:
         return await message.reply_text("**__Give The Suffix__\n\nExample:- `/set_suffix @Madflix_Bots`**")
     suffix = message.text.split(" ", 1)[1]
+    try:
+        compile_template(suffix)
+    except TemplateError as e:
+        return await message.reply_text(f"**{e} ❌**")
     JishuDeveloper = await message.reply_text("Please Wait ...")
     await jishubotz.set_suffix(message.from_user.id, suffix)
     await JishuDeveloper.edit("**Suffix Saved Successfully ✅**")
@@ -3,6 +3,7 @@ import random
 from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup, ForceReply, CallbackQuery
 from helper.database import jishubotz
+from helper.scheduler import scheduler
 from config import Config, Txt  
   
 
@@ -59,6 +60,8 @@ async def cb_handler(client, query: CallbackQuery):
             ])            
         )
     elif data == "close":
+        # Stop the job behind a progress message together with its ffmpeg processes
+        scheduler.cancel(query.message.chat.id, query.message.id)
         try:
             await query.message.delete()
             await query.message.reply_to_message.delete()